@@ -13,45 +13,78 @@ if ($agentService) {
   Exit 0
 }
 
-# If the SSM_HOST environment variable does not begin with 'https://', prepends it
-if (!$env:SSM_HOST.StartsWith('https://')) {
-  $env:SSM_HOST = 'https://' + $env:SSM_HOST
+# Reads the mirror.env written by packager.py --mirror, if the package was built with it
+$installerPath = $null
+$mirrorConfigPath = Join-Path -Path $PSScriptRoot -ChildPath 'mirror.env'
+if (Test-Path -Path $mirrorConfigPath) {
+  $mirror = @{}
+  Get-Content -Path $mirrorConfigPath | ForEach-Object {
+    $key, $value = $_.Split('=', 2)
+    $mirror[$key] = $value
+  }
+  $mirrorPath = Join-Path -Path $PSScriptRoot -ChildPath $mirror['SENSOR_FILE']
+  try {
+    if (Get-Command -Name Read-S3Object -ErrorAction SilentlyContinue) {
+      $bucketKey = $mirror['MIRROR_S3_URL'].Substring(5).Split('/', 2)
+      Read-S3Object -BucketName $bucketKey[0] -Key $bucketKey[1] -File $mirrorPath -Region $mirror['MIRROR_REGION'] | Out-Null
+    }
+    else {
+      Invoke-WebRequest -Uri $mirror['MIRROR_HTTPS_URL'] -OutFile $mirrorPath -UseBasicParsing
+    }
+    if ((Get-FileHash -Path $mirrorPath -Algorithm SHA256).Hash -eq $mirror['SENSOR_SHA256']) {
+      $installerPath = $mirrorPath
+    }
+    else {
+      Remove-Item -Path $mirrorPath -Force
+      Write-Output "Mirrored installer does not match its sha256, falling back to the CrowdStrike API..."
+    }
+  }
+  catch {
+    Write-Output "Unable to download the mirrored installer, falling back to the CrowdStrike API..."
+  }
 }
 
-# Removes any trailing slashes from the SSM_HOST environment variable
-if ($env:SSM_HOST.EndsWith('/')) {
-  $env:SSM_HOST = $env:SSM_HOST.TrimEnd('/')
-}
+if (-not $installerPath) {
+  # If the SSM_HOST environment variable does not begin with 'https://', prepends it
+  if (!$env:SSM_HOST.StartsWith('https://')) {
+    $env:SSM_HOST = 'https://' + $env:SSM_HOST
+  }
 
-$headers =  @{
-  'Authorization' = "Bearer ${env:SSM_AUTH_TOKEN}"
-  'User-Agent' = 'crowdstrike-custom-api-distributor-package/v1.0.0'
-}
+  # Removes any trailing slashes from the SSM_HOST environment variable
+  if ($env:SSM_HOST.EndsWith('/')) {
+    $env:SSM_HOST = $env:SSM_HOST.TrimEnd('/')
+  }
 
-# Sends a GET request to the CrowdStrike API to retrieve the latest installer information
-$installerQueryResp = Invoke-RestMethod -Method Get -Uri "${env:SSM_HOST}/sensors/combined/installers/v1?offset=1&limit=1&sort=version&filter=platform:'windows'" -Headers $headers -ErrorAction Stop
+  $headers =  @{
+    'Authorization' = "Bearer ${env:SSM_AUTH_TOKEN}"
+    'User-Agent' = 'crowdstrike-custom-api-distributor-package/v1.0.0'
+  }
 
-# If the API response does not contain a valid sha256 value, throws an exception
-if (!$installerQueryResp.resources[0].sha256) {
-  throw 'API response does not contain a valid sha256 value'
-}
+  # Sends a GET request to the CrowdStrike API to retrieve the latest installer information
+  $installerQueryResp = Invoke-RestMethod -Method Get -Uri "${env:SSM_HOST}/sensors/combined/installers/v1?offset=1&limit=1&sort=version&filter=platform:'windows'" -Headers $headers -ErrorAction Stop
+
+  # If the API response does not contain a valid sha256 value, throws an exception
+  if (!$installerQueryResp.resources[0].sha256) {
+    throw 'API response does not contain a valid sha256 value'
+  }
 
-# Extracts the sha256 hash and name of the installer from the API response
-$installerSha256 = $installerQueryResp.resources[0].sha256
-$installerName = $installerQueryResp.resources[0].name
+  # Extracts the sha256 hash and name of the installer from the API response
+  $installerSha256 = $installerQueryResp.resources[0].sha256
+  $installerName = $installerQueryResp.resources[0].name
 
-# Constructs the URL to download the installer
-$downloadUrl = "${env:SSM_HOST}/sensors/entities/download-installer/v1?id=$installerSha256"
+  # Constructs the URL to download the installer
+  $downloadUrl = "${env:SSM_HOST}/sensors/entities/download-installer/v1?id=$installerSha256"
 
-# Constructs the full path to save the installer to
-$installerPath = Join-Path -Path $PSScriptRoot -ChildPath $installerName
+  # Constructs the full path to save the installer to
+  $installerPath = Join-Path -Path $PSScriptRoot -ChildPath $installerName
 
-# Downloads the installer and saves it to the specified path
-$downloadSensorResp = Invoke-WebRequest -Uri $downloadUrl -OutFile $installerPath -Headers $headers -ErrorAction Stop
+  # Downloads the installer and saves it to the specified path
+  $downloadSensorResp = Invoke-WebRequest -Uri $downloadUrl -OutFile $installerPath -Headers $headers -ErrorAction Stop
 
-# If the installer fails to download, throws an exception
-if (-not (Test-Path -Path $installerPath)) {
-  throw "Failed to download the file. Error $(ConvertTo-Json $downloadSensorResp -Depth 10)"
+  # If the installer fails to download, throws an exception
+  if (-not (Test-Path -Path $installerPath)) {
+    throw "Failed to download the file. Error $(ConvertTo-Json $downloadSensorResp -Depth 10)"
+  }
 }
 
 # If the SSM_CID environment variable is not set, throws an exception
@@ -0,0 +1,69 @@
+"""Render the Linux install script of each Distributor platform.
+
+The platform facts and the sensor pinned for the platform are baked into
+templates/install.sh at build time, so the script on the instance only
+checks that it runs on the platform it was built for, then downloads the
+pinned sensor, verifies its sha256 and installs it.
+"""
+import re
+import shlex
+
+INSTALL_SCRIPT_TEMPLATE = "templates/install.sh"
+# os-release IDs and package type per Distributor platform
+LINUX_PLATFORMS = {
+    "amazon": ("amzn", "yum"),
+    "redhat": ("rhel", "yum"),
+    "centos": ("centos", "yum"),
+    "oracle": ("ol", "yum"),
+    "suse": ("sles sles_sap", "zypper"),
+    "ubuntu": ("ubuntu", "apt"),
+    "debian": ("debian", "apt"),
+}
+UNAME_ARCH = {"x86_64": "x86_64", "arm64": "aarch64"}
+
+
+def linux_platform_facts(mapping, sensor):
+    """Return the values baked into a platform's generated install.sh.
+
+    :param mapping: PackageMapping of a linux platform
+    :param sensor: Values from SensorMirror.resolve, with at least
+        SENSOR_FILE and SENSOR_SHA256
+    :return: Dictionary of template placeholder values
+    :raises ValueError: If the platform or its sensor is unknown
+    """
+    if mapping.name not in LINUX_PLATFORMS:
+        raise ValueError(f"Unsupported linux platform {mapping.name} in {mapping.dir}")
+    if not sensor or not sensor.get("SENSOR_SHA256"):
+        raise ValueError(f"No sensor pinned for {mapping.dir}")
+    os_ids, packager = LINUX_PLATFORMS[mapping.name]
+    # An "_any" major version accepts every release of the distribution
+    major_version = "" if mapping.major_version == "_any" else mapping.major_version
+    facts = {
+        "PLATFORM": f"{mapping.name} {mapping.major_version} {mapping.arch_type}",
+        "OS_IDS": os_ids,
+        "OS_MAJOR_VERSION": major_version,
+        "OS_ARCH": UNAME_ARCH.get(mapping.arch_type, ""),
+        "PACKAGER": mapping.extras.get("install_tool", packager),
+        "MIRROR_REGION": "",
+        "MIRROR_S3_URL": "",
+        "MIRROR_HTTPS_URL": "",
+    }
+    facts.update(sensor)
+    return facts
+
+
+def render_install_script(template, facts):
+    """Fill the @KEY@ placeholders of the install script template.
+
+    Values are shell quoted, except the PLATFORM comment.
+
+    :raises ValueError: If a placeholder is left unfilled
+    """
+    script = template
+    for key, value in facts.items():
+        quoted = value if key == "PLATFORM" else shlex.quote(value)
+        script = script.replace(f"@{key}@", quoted)
+    leftover = re.findall(r"@[A-Z_]+@", script)
+    if leftover:
+        raise ValueError(f"Unfilled placeholders in install script: {leftover}")
+    return script
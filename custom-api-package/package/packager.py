@@ -2,382 +2,212 @@
 
 This example demonstrates creating a bundled Falcon Sensor
 distributor package within AWS Systems Manager.
+
+The Linux install scripts are rendered for each platform at build time,
+with the sensor of the platform pinned by its sha256, and the sensors can
+optionally be mirrored into the package bucket. The packaging engine is
+shared with the custom-binary package and lives in the distributor
+directory at the root of the repository.
 """
 import argparse
 import hashlib
-import json
-import logging
 import os
-import shutil
 import sys
-import time
-import zipfile
 from functools import cached_property
-from logging.handlers import RotatingFileHandler
-from os.path import basename
-
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger()
-handler = logging.StreamHandler()
-formatter = logging.Formatter("%(levelname)-8s %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
-
-PATH_TO_BUCKET_FOLDER = "./s3-bucket/"
-PACKAGE_DESCRIPTION = "CrowdStrike custom Install Package"
-INSTALLER_VERSION = "1.0"
-OS_LIST = ["windows", "linux"]
-
-
-class SSMPackageUpdater:  # pylint: disable=R0903
-    """Class to represent our SSM package update."""
-
-    def __init__(self, region_name):
-        self.region = region_name
-
-    def update(self, package, file_to_upload):
-        """Update the SSM package."""
-        with open(file_to_upload, "r", encoding="utf-8") as open_file:
-            document_content = open_file.read()
-        self._doc_update_or_create(
-            Content=document_content,
-            Attachments=[
-                {
-                    "Key": "SourceUrl",
-                    "Values": [
-                        "https://"
-                        + s3bucket
-                        + ".s3-"
-                        + self.region
-                        + ".amazonaws.com/falcon",
-                    ],
-                },
-            ],
-            Name=package,
-            DocumentType="Package",
-            DocumentFormat="JSON",
-        )
-
-        print(f"Created ssm package {package}:")
-
-    def _doc_update_or_create(self, **kwargs):
-        """Determine if this is an update or create."""
-        if self._doc_exists(kwargs["Name"]):
-            self._doc_update(**kwargs)
-        else:
-            self._client.create_document(**kwargs)
-
-    def _doc_exists(self, package):
-        """Document exists."""
-        try:
-            current_doc = self._client.get_document(Name=package)
-        except self._client.exceptions.InvalidDocument:
-            current_doc = {}
-        return current_doc
-
-    def _doc_update(self, **kwargs):
-        """Perform the document update."""
-        del kwargs["DocumentType"]
-        kwargs["DocumentVersion"] = "$LATEST"
-        try:
-            updated = self._client.update_document(**kwargs)
-        except self._client.exceptions.DuplicateDocumentContent:
-            print("AWS SSM Package is already up to date with the latest version")
-            return
-        except self._client.exceptions.DocumentVersionLimitExceeded:
-            self._doc_cleanup_versions(kwargs["Name"])
-            updated = self._client.update_document(**kwargs)
-
-        self._client.update_document_default_version(
-            Name=kwargs["Name"],
-            DocumentVersion=updated["DocumentDescription"]["DocumentVersion"],
-        )
-
-    def _doc_cleanup_versions(self, package):
-        """Cleanup document versions."""
-        for version in self._client.list_document_versions(Name=package)[
-            "DocumentVersions"
-        ]:
-            if version["IsDefaultVersion"]:
-                continue
-            self._client.delete_document(
-                Name=package, DocumentVersion=version["DocumentVersion"]
-            )
 
-    @cached_property
-    def _client(self):
-        """Return an instance of the SSM boto3 client."""
-        return boto3.client("ssm", region_name=self.region)
-
-
-class S3BucketUpdater:  # pylint: disable=R0903
-    """Class to represent our S3 Bucket update."""
-
-    def __init__(self, region_name):
-        self.region = region_name
-
-    def update(self, bucket_name, file_list, prefix=""):
-        """Update the bucket contents."""
-        if not self._bucket_exists(bucket_name):
-            self._create_bucket(bucket_name)
-        for file in file_list:
-            file_path = PATH_TO_BUCKET_FOLDER + file
-            self._upload_file(file_path, bucket_name, prefix + file)
-
-    def _bucket_exists(self, bucket_name):
+import _bootstrap  # pylint: disable=W0611
+from distributor import backends
+from distributor.packager import (
+    PATH_TO_BUCKET_FOLDER,
+    DistributorPackager,
+    add_arguments,
+    run,
+)
+from install_script import (
+    INSTALL_SCRIPT_TEMPLATE,
+    linux_platform_facts,
+    render_install_script,
+)
+
+MIRROR_PREFIX = "sensors/"
+MIRROR_CONFIG_FILE = "mirror.env"
+
+
+class SensorMirror:
+    """Resolve the N-minus sensor for each platform and optionally mirror it to S3.
+
+    When mirroring, each installer is downloaded once per sha256 and stored
+    next to the package zips, so instances install from the in-region
+    bucket instead of authenticating to the Falcon API and downloading it
+    themselves.
+    """
+
+    def __init__(self, bucket_name, region_name, n_minus=1, download=True):
         """
-        Checks that the S3 bucket exists in the region
-        :param bucket_name: The name of the S3 bucket
-        :return: True or False
+        :param bucket_name: The S3 bucket the package is uploaded to
+        :param region_name: The region of the S3 bucket
+        :param n_minus: Which sensor version to mirror, 0 for the latest
+        :param download: Mirror the installers, or only pin their sha256
         """
-        try:
-            response = self._client.list_buckets()
-        except ClientError as err:
-            print(f"Error listing buckets {err}")
-
-        # Output True if bucket exists
-
-        for bucket in response["Buckets"]:
-            if bucket_name == bucket["Name"]:
-                print("Bucket already exists:")
-                return True
-        return False
-
-    def _create_bucket(self, bucket_name):
-        """Create an S3 bucket
-
-        :param bucket_name: Bucket to create
-        :return: True if bucket created, else False
-        """
-
-        print("Creating bucket:")
-        location = {"LocationConstraint": self.region}
-        self._client.create_bucket(
-            Bucket=bucket_name, CreateBucketConfiguration=location
-        )
-
-    def _upload_file(self, file_name, bucket, object_name=None):
-        """Upload a file to an S3 bucket
-
-        :param file_name: File to upload
-        :param bucket: Bucket to upload to
-        :param object_name: S3 object name. If not specified then file_name is used
-        :return: True if file was uploaded, else False
+        self.bucket_name = bucket_name
+        self.region = region_name
+        self.n_minus = n_minus
+        self.download = download
+        self._downloads = {}
+
+    def resolve(self, mapping, published=()):
+        """Resolve, and when mirroring download, the sensor for an agent_list.json entry.
+
+        :param mapping: PackageMapping with a "filter" key
+        :param published: Files of the published package, mirrored installers
+            among them are not downloaded again
+        :return: Tuple of (mirrored file name relative to the bucket folder
+            or None, dictionary of SENSOR_* and MIRROR_* values)
         """
-        # If S3 object_name was not specified, use file_name
-        if object_name is None:
-            object_name = file_name
-
-        try:
-            start_time = time.time()
-            print(f"Uploading file {file_name}:")
-            with open(file_name, "rb") as content:
-                self._client.put_object(Bucket=bucket, Key=object_name, Body=content)
-            time_taken = time.time() - start_time
+        sensor = self._resolve(mapping.extras["filter"])
+        sha = sensor["sha256"]
+        values = {"SENSOR_FILE": sensor["name"], "SENSOR_SHA256": sha}
+        if not self.download:
+            return None, values
+        file_name = f"{MIRROR_PREFIX}{sha}/{sensor['name']}"
+        if sha not in self._downloads and file_name not in published:
             print(
-                f"Successfully finished uploading files to s3 bucket. Took {time_taken}s"
+                f"Mirroring {sensor['name']} for {sensor['os']} {sensor['os_version']}"
             )
-        except (BotoCoreError, ClientError) as err:
-            print(f"Upload error {err}")
-            return False
-        return True
-
-    @cached_property
-    def _client(self):
-        return boto3.client("s3", region_name=self.region)
-
-
-class DistributorPackager:  # pylint: disable=R0903
-    """Class to represent a Distributor package."""
+            self._download(sha, PATH_TO_BUCKET_FOLDER + file_name)
+            self._downloads[sha] = file_name
+        key = "falcon/" + file_name
+        values.update(
+            {
+                "MIRROR_REGION": self.region,
+                "MIRROR_S3_URL": f"s3://{self.bucket_name}/{key}",
+                "MIRROR_HTTPS_URL": f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{key}",
+            }
+        )
+        return file_name, values
+
+    def _resolve(self, sensor_filter):
+        """Return the N-minus sensor matching the Falcon installer filter."""
+        sensors = self._falcon.command(
+            action="GetCombinedSensorInstallersByQuery",
+            filter=sensor_filter,
+            sort="version.desc",
+        )
+        resources = sensors["body"].get("resources", [])
+        if len(resources) == 0:
+            print(f"Unable to find sensor that matches filter: {sensor_filter}")
+            sys.exit(1)
+        return resources[min(self.n_minus, len(resources) - 1)]
 
-    def build(self, mappings_file):
-        """Build the package."""
-        dirs = set()
-        file_list = set()
-        # arch = set()
+    def _download(self, sha, file_path):
+        """Download an installer and verify its sha256."""
+        download = self._falcon.command(action="DownloadSensorInstallerById", id=sha)
+        if isinstance(download, dict):
+            print(f"Unable to download sensor {sha}")
+            sys.exit(1)
+        if hashlib.sha256(download).hexdigest() != sha:
+            print(f"Downloaded sensor {sha} does not match its sha256")
+            sys.exit(1)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as save_file:
+            save_file.write(download)
 
-        installer_list = self._parse_mappings(mappings_file)
-        dir_list = os.listdir()
+    @cached_property
+    def _falcon(self):
+        """Return an authenticated Falcon API client."""
+        client_id = os.environ.get("FALCON_CLIENT_ID")
+        client_secret = os.environ.get("FALCON_CLIENT_SECRET")
+        if (not client_id or not client_secret) and not backends.is_local():
+            raise SystemExit(
+                "FALCON_CLIENT_ID and FALCON_CLIENT_SECRET must be set to resolve the sensors."
+            )
+        return backends.falcon_client(client_id, client_secret)
 
-        for os_type in OS_LIST:
-            for installer in installer_list[os_type]:
-                dirs.add(installer["dir"])
-                file_list.add(installer["file"])
 
-        folders_exist = all(item in dir_list for item in dirs)
-        if not folders_exist:
-            print("Check agent list file - Required directories do not exist")
-            sys.exit(1)
-        for directory in dirs:
-            self._create_zip_files(directory)
-        hashes_list = self._get_digest(file_list)
-        self._generate_manifest(installer_list, hashes_list)
-        file_list.add("manifest.json")
-        return file_list
+class ApiDistributorPackager(DistributorPackager):
+    """Distributor package whose install scripts fetch the sensor."""
 
-    @classmethod
-    def _parse_mappings(cls, filename):
-        """
-        :param filename: Name of the file
-        :return: Returns a dictionary containing required configuration data
-        """
-        with open(filename, "rb") as file_handle:
-            json_data = json.loads(file_handle.read())
-        return json_data
+    WATCH_PATHS = (os.path.dirname(INSTALL_SCRIPT_TEMPLATE),)
 
-    @staticmethod
-    def _generate_manifest(
-        zip_distros_meta_list, hashes
-    ):  # pylint: disable=R0914, R0912
+    def __init__(self, mirror=None, **kwargs):
         """
-        Generates the manifest.json file required to create the ssm document
-        :param installer_list: List containing key value pairs required to construct the file
-        :param hashes: list of dictionary items {filename : sha256hash}
-        :return:
+        :param mirror: SensorMirror used to pin, and optionally mirror, the
+            installers. Required to build Linux platforms.
+        :param kwargs: DistributorPackager arguments
         """
-        manifest_dict = {}
-        manifest_packages_meta = {}
-        manifest_dict = {
-            "schemaVersion": "2.0",
-            "publisher": "Crowdstrike Inc.",
-            "description": PACKAGE_DESCRIPTION,
-            "version": INSTALLER_VERSION,
-        }
-        # manifest_files_meta = {}
-        for os_type in OS_LIST:
-            for each_zip_distro_meta in zip_distros_meta_list[os_type]:
-                name = each_zip_distro_meta["name"]
-                arch_type = each_zip_distro_meta["arch_type"]
-                version = each_zip_distro_meta["major_version"]
-                if not len(each_zip_distro_meta["minor_version"]) == 0:
-                    version = version + "." + each_zip_distro_meta["minor_version"]
-
-                if name in manifest_packages_meta:
-                    pass
-                else:
-                    manifest_packages_meta[name] = {}
+        super().__init__(**kwargs)
+        self.mirror = mirror
 
-                if version in manifest_packages_meta[name]:
-                    pass
-                else:
-                    manifest_packages_meta[name][version] = {}
+    def generate_files(self, mapping_index):
+        """Render install.sh for each Linux platform and mirror.env for Windows.
 
-                if arch_type in manifest_packages_meta[name][version]:
-                    pass
-                else:
-                    manifest_packages_meta[name][version][arch_type] = {}
-
-                manifest_packages_meta[name][version][arch_type] = {
-                    "file": each_zip_distro_meta["file"]
-                }
-
-        try:
-            manifest_dict["packages"] = manifest_packages_meta
-            obj = {}
-            for hash_val in hashes:
-                for key, val in hash_val.items():
-                    obj.update({key: {"checksums": {"sha256": val}}})
-            # print(obj)
-            file_list = {"files": obj}
-            manifest_dict.update(file_list)
-        except (KeyError, ValueError) as err:
-            print(f"Exception {err}")
-        try:
-            with open(
-                (PATH_TO_BUCKET_FOLDER + "manifest.json"), "w", encoding="utf-8"
-            ) as file:
-                file.write(json.dumps(manifest_dict))
-        except (FileNotFoundError, FileExistsError, OSError) as err:
-            print(err)
-
-    @staticmethod
-    def _create_zip_files(directory):
-        """Create a zip file from the contents of the specified directory."""
-        with zipfile.ZipFile(
-            PATH_TO_BUCKET_FOLDER + directory + ".zip", "w", zipfile.ZIP_DEFLATED
-        ) as zipf:
-            for root, _, file_list in os.walk(directory + "/"):
-                for file in file_list:
-                    file_path = os.path.join(root, file)
-                    zipf.write(file_path, basename(file_path))
-
-    @staticmethod
-    def _get_digest(file_list):
+        :param mapping_index: The MappingIndex of the platforms being built
+        :return: Tuple of ({directory: {file name: content}}, {mirrored
+            installer file: sha256})
         """
-        Generate sha256 of hash
-        :param files:
-        :return:
-        """
-        hashes = []
-        for file in file_list:
-            file_path = PATH_TO_BUCKET_FOLDER + file
-            with open(file_path, "rb") as file_handle:
-                read_bytes = file_handle.read()  # read entire file as bytes
-                readable_hash = hashlib.sha256(read_bytes).hexdigest()
-                hashes.append({file: readable_hash})
-        return hashes
+        with open(INSTALL_SCRIPT_TEMPLATE, "r", encoding="utf-8") as template_file:
+            install_template = template_file.read()
+        published = self.live_manifest["files"] if self.live_manifest else {}
+        generated_files = {}
+        sensor_files = {}
+        for mapping in mapping_index:
+            linux = mapping.os_type == "linux"
+            if linux and (self.mirror is None or "filter" not in mapping.extras):
+                print(
+                    f"Unable to pin the sensor of {mapping.dir}: linux entries of "
+                    "agent_list.json need a Falcon installer \"filter\"."
+                )
+                sys.exit(1)
+            sensor = None
+            if "filter" in mapping.extras and (linux or self.mirror.download):
+                sensor_file, sensor = self.mirror.resolve(mapping, published)
+                if sensor_file is not None:
+                    sensor_files[sensor_file] = sensor["SENSOR_SHA256"]
+            if linux:
+                generated_files[mapping.dir] = {
+                    "install.sh": render_install_script(
+                        install_template, linux_platform_facts(mapping, sensor)
+                    )
+                }
+            elif sensor and "MIRROR_S3_URL" in sensor:
+                generated_files[mapping.dir] = {
+                    MIRROR_CONFIG_FILE: "".join(
+                        f"{key}={value}\n" for key, value in sensor.items()
+                    )
+                }
+        return generated_files, sensor_files
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Create and upload Distributor packages to the AWS SSM"
     )
+    add_arguments(parser)
     parser.add_argument(
-        "-r",
-        "--aws_region",
-        help="The aws region to create the ssm distributor package in.",
-    )
-    parser.add_argument(
-        "-p",
-        "--package_name",
-        help="The name of the distributor package to create.",
-        default="CrowdStrike-FalconSensor",
+        "-m",
+        "--mirror",
+        action="store_true",
+        help="Download the sensor for each platform once and serve it to instances from the s3 bucket. "
+        "Requires the FALCON_CLIENT_ID and FALCON_CLIENT_SECRET environment variables.",
     )
     parser.add_argument(
-        "-b",
-        "--s3bucket",
-        help="The name of the s3 bucket to upload the required files to.",
+        "-n",
+        "--n_minus",
+        type=int,
+        default=1,
+        help="The N-minus sensor version pinned in the install scripts, 0 for the latest.",
     )
 
     args = parser.parse_args()
 
-    region = args.aws_region
-    package_name = args.package_name
+    # The sensors are mirrored into the bucket of the first region
+    region = args.aws_regions.split(",")[0] if args.aws_regions else None
     s3bucket = args.s3bucket
 
+    if args.mirror and (region is None or s3bucket is None):
+        print("--mirror requires --aws_region and --s3bucket")
+        sys.exit(1)
+    # The sensor of each platform is resolved and pinned at build time
+    sensor_mirror = SensorMirror(s3bucket, region, args.n_minus, download=args.mirror)
 
-    if not os.path.exists(PATH_TO_BUCKET_FOLDER):
-        os.makedirs(PATH_TO_BUCKET_FOLDER)
-
-    files = DistributorPackager().build("agent_list.json")
-
-    if region is None or s3bucket is None:
-        print(
-            "Skipping AWS upload: please provide --aws_region, --ssm_automation_doc_name, and --s3bucket command-line "
-            "options for upload"
-        )
-
-    S3BucketUpdater(region).update(s3bucket, files, "falcon/")
-    print("Package file have been built and uploaded successfully.")
-
-    if package_name is not None:
-        SSMPackageUpdater(region).update(
-            package_name, PATH_TO_BUCKET_FOLDER + "manifest.json"
-        )
-        print("Distributor package has been built successfully.")
-
-    # loop over PATH_TO_BUCKET_FOLDER and upload all files to S3 that are not in files list
-    supporting_files = []
-    for file in os.listdir(PATH_TO_BUCKET_FOLDER):
-        if file not in files:
-            supporting_files.append(file)
-
-    if len(supporting_files) > 0:
-        S3BucketUpdater(region).update(s3bucket, supporting_files)
-
-    print("Cleaning up files...")
-    shutil.rmtree(PATH_TO_BUCKET_FOLDER)
+    run(args, ApiDistributorPackager, mirror=sensor_mirror)
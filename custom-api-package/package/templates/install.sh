@@ -1,16 +1,27 @@
 #!/bin/bash
+#
+# Distributor package installer - @PLATFORM@
+#
+# Generated by packager.py from templates/install.sh. The platform facts,
+# package type and pinned sensor below are filled in at build time, so the
+# script only checks its target, then downloads, verifies and installs the
+# pinned sensor.
+#
+OS_IDS=@OS_IDS@
+OS_MAJOR_VERSION=@OS_MAJOR_VERSION@
+OS_ARCH=@OS_ARCH@
+PACKAGER=@PACKAGER@
+SENSOR_FILE=@SENSOR_FILE@
+SENSOR_SHA256=@SENSOR_SHA256@
+MIRROR_REGION=@MIRROR_REGION@
+MIRROR_S3_URL=@MIRROR_S3_URL@
+MIRROR_HTTPS_URL=@MIRROR_HTTPS_URL@
 
 echoRed() {
     echo -e "\033[0;31m$1\033[0m"
     echo ""
 }
 
-jsonValue() {
-    KEY=$1
-    num=$2
-    awk -F"[,:}]" '{for(i=1;i<=NF;i++){if($i~/'"$KEY"'\042/){print $(i+1)}}}' | tr -d '"' | sed -n "${num}p"
-}
-
 usage() {
     cat << EOF
 Script to download and install the CrowdStrike Falcon sensor.
@@ -48,7 +59,6 @@ Environment Variables:
 AWS Systems Manager (SSM) integration:
   SSM_AUTH_TOKEN will override the value of CS_FALCON_OAUTH_TOKEN.
   SSM_CID will override the value of CS_FALCON_CID
-  SSM_NCNT will set the "N-" version count. (2 = N-2 version)
   SSM_LINUXINSTALLPARAMS will set installer parameters, overriding environment / parameter values
   SSM_INSTALLTOKEN will set the provisioning token, overriding environment / parameter values
 EOF
@@ -56,17 +66,33 @@ EOF
 
 userAgent="crowdstrike-custom-api-distributor-package/v1.0.0"
 
-osDetail(){
-  UN=$(uname -s)
-  if [[ "$UN" == "Darwin" ]]
-  then
-	OS_NAME="Darwin"
-	OS_VERSION=$(uname -r)
-  else
-	OS_NAME=$(cat /etc/*release | grep NAME= | awk '!/CODENAME/ && !/PRETTY_NAME/' | awk '{ print $1 }' | awk -F'=' '{ print $2 }' | sed "s/\"//g")
-	OS_NAME=$(echo $OS_NAME | awk '{ print $1 }')
-	OS_VERSION=$(cat /etc/*release | grep VERSION_ID= | awk '{ print $1 }' | awk -F'=' '{ print $2 }' | sed "s/\"//g")
-  fi
+# Make sure the package was dispatched to the platform it was built for
+verifyTarget(){
+   if [ -f /etc/os-release ]
+   then
+       . /etc/os-release
+   fi
+   case " $OS_IDS " in
+       *" $ID "* ) ;;
+       * )
+           echoRed "This package was built for $OS_IDS, not ${ID:-unknown}"
+           return 1
+           ;;
+   esac
+   if [ -n "$OS_MAJOR_VERSION" ] && [ "${VERSION_ID%%.*}" != "$OS_MAJOR_VERSION" ]
+   then
+       echoRed "This package was built for version $OS_MAJOR_VERSION, not ${VERSION_ID:-unknown}"
+       return 1
+   fi
+   if [ -n "$OS_ARCH" ] && [ "$(uname -m)" != "$OS_ARCH" ]
+   then
+       echoRed "This package was built for $OS_ARCH, not $(uname -m)"
+       return 1
+   fi
+}
+
+verifySha(){
+   [ -f "$1" ] && [ "$(sha256sum "$1" | cut -d ' ' -f 1)" == "$2" ]
 }
 
 rpmInstall(){
@@ -77,6 +103,14 @@ rpmInstall(){
    rm $1
 }
 
+zypperInstall(){
+   zypper --non-interactive install libnl3-200
+   rpm -ivh $1
+   /opt/CrowdStrike/falconctl -s -f --cid=$2 $3 $4
+   systemctl restart falcon-sensor
+   rm $1
+}
+
 aptInstall(){
    # May need to move this over to snap for Ubuntu 20
    apt-get -y install libnl-genl-3-200 libnl-3-200
@@ -87,16 +121,62 @@ aptInstall(){
    rm $1
 }
 
+sensorInstall(){
+   echo "Sensor binary output to: $filename"
+   case "$PACKAGER" in
+       apt )
+           aptInstall $filename $CS_FALCON_CID $CS_INSTALL_PARAMS $CS_INSTALL_TOKEN
+           ;;
+       zypper )
+           zypperInstall $filename $CS_FALCON_CID $CS_INSTALL_PARAMS $CS_INSTALL_TOKEN
+           ;;
+       * )
+           rpmInstall $filename $CS_FALCON_CID $CS_INSTALL_PARAMS $CS_INSTALL_TOKEN
+           ;;
+   esac
+}
+
+# Fetch the sensor mirrored by packager.py --mirror from the package's S3 bucket
+mirrorDownload(){
+   filename="./$SENSOR_FILE"
+   if command -v aws >/dev/null 2>&1
+   then
+       aws s3 cp "$MIRROR_S3_URL" "$filename" --region "$MIRROR_REGION" --only-show-errors
+   fi
+   if [ ! -f "$filename" ]
+   then
+       curl -s -f -L "$MIRROR_HTTPS_URL" -H "User-Agent: $userAgent" -o "$filename"
+   fi
+   if ! verifySha "$filename" "$SENSOR_SHA256"
+   then
+       echoRed "Unable to download a verified sensor from $MIRROR_S3_URL"
+       rm -f "$filename"
+       return 1
+   fi
+}
+
+# Download the pinned sensor from the Falcon API
+apiDownload(){
+   filename="./$SENSOR_FILE"
+   curl -s -L "https://$SSM_HOST/sensors/entities/download-installer/v1?id=$SENSOR_SHA256" \
+       -H "Authorization: Bearer $CS_FALCON_OAUTH_TOKEN" \
+       -H "User-Agent: $userAgent" \
+       -o "$filename"
+   if ! verifySha "$filename" "$SENSOR_SHA256"
+   then
+       echoRed "Downloaded sensor does not match sha256 $SENSOR_SHA256"
+       rm -f "$filename"
+       return 1
+   fi
+}
+
 if [ "$1" = "-h" ]; then
     usage
     exit
 fi
 
-NCNT=${SSM_NCNT}
-if [ -z "$NCNT" ]
-then
-  NCNT=0
-fi
+verifyTarget || exit 1
+
 CS_FALCON_OAUTH_TOKEN=${CS_FALCON_OAUTH_TOKEN}
 if ! [ -z "$SSM_AUTH_TOKEN" ]
 then
@@ -137,14 +217,21 @@ then
     CS_INSTALL_TOKEN="--provisioning-token=${SSM_INSTALLTOKEN}"
 fi
 
-if ! [ -z "$SSM_HOST" ]
+if [ -z "$CS_FALCON_CID" ]
 then
-    if [[ "$SSM_HOST" == "https://"* ]] || [[ "$SSM_HOST" == "http://"* ]]
-    then
-        SSM_HOST=$(echo $SSM_HOST | sed 's/https\?:\/\///')
-    fi
+    echoRed "CS_FALCON_CID must be provided in order to perform installation."
+    exit 1
+fi
+
+if [ -n "$MIRROR_S3_URL" ] && mirrorDownload
+then
+    sensorInstall
+    exit 0
 fi
 
+SSM_HOST=${SSM_HOST#http://}
+SSM_HOST=${SSM_HOST#https://}
+
 if [ -z "$CS_FALCON_OAUTH_TOKEN" ] && [ -z "$CS_FALCON_CLIENT_ID" ] && [ -z "$CS_FALCON_CLIENT_SECRET" ]; then
     echoRed "Missing Falcon OAUTH Token or Client ID and Secret Environment Variable(s)"
     usage
@@ -159,7 +246,7 @@ elif [ -z "$CS_FALCON_OAUTH_TOKEN" ]; then
                         -H 'Content-Type: application/x-www-form-urlencoded; charset=utf-8' \
                         -H "User-Agent: $userAgent" \
                         -d "client_id=$CS_FALCON_CLIENT_ID&client_secret=$CS_FALCON_CLIENT_SECRET")
-        CS_FALCON_OAUTH_TOKEN=$(echo "$tokenResult" | jsonValue "access_token" | sed 's/ *$//g' | sed 's/^ *//g')
+        CS_FALCON_OAUTH_TOKEN=$(echo "$tokenResult" | tr -d '\n' | sed -n 's/.*"access_token" *: *"\([^"]*\)".*/\1/p')
         if [ -z "$CS_FALCON_OAUTH_TOKEN" ]; then
             echoRed "Unable to retrieve oauth token from api"
             exit 1
@@ -167,106 +254,5 @@ elif [ -z "$CS_FALCON_OAUTH_TOKEN" ]; then
     fi
 fi
 
-if [ -z "$CS_FALCON_CID" ]
-then
-    echoRed "CS_FALCON_CID must be provided in order to perform installation."
-    exit 1
-fi
-
-osDetail
-OUTPUT_DESTINATION="."
-
-case "$OS_NAME" in
-    deb?*|Deb?*|ubu?*|Ubu?* )
-        OS_NAME="Debian"
-	PACKAGER="apt"
-        ;;
-    rhel|RHEL|red?*|cent?*|Red?*|Cent?*|ora?*|Ora?* )
-        OS_NAME="RHEL/CentOS/Oracle"
-    	PACKAGER="yum"
-        ;;
-    sles|SLES )
-        OS_NAME="SLES"
-	PACKAGER="zypper"
-        ;;
-    amz?*|Ama?*|ama?* )
-        OS_NAME="Amazon Linux"
-	PACKAGER="yum"
-        ;;
-    win?*|Win?* )
-        OS_NAME="Windows"
-	PACKAGER="exe"
-        ;;
-esac
-
-OS_VERSION=2
-if [[ "$(uname -p)" != *86* ]]
-then
-    OS_VERSION="$OS_VERSION - arm64"
-fi
-
-## Get Installer Versions
-jsonResult=$(curl -s -L -G "https://$SSM_HOST/sensors/combined/installers/v1" \
-    --data-urlencode "filter=os:\"$OS_NAME\"" \
-    -H "Authorization: Bearer $CS_FALCON_OAUTH_TOKEN" \
-    -H "User-Agent: $userAgent")
-
-if [[ $jsonResult == *"denied"* ]]; then
-    echoRed "Invalid Access Token"
-    exit 1
-fi
-#echo $jsonResult
-sha_list=$(echo "$jsonResult" | jsonValue "sha256")
-if [ -z "$sha_list" ]; then
-    echoRed "No sensor found for with OS Name: $OS_NAME"
-    exit 1
-fi
-
-INDEX=1
-if [ -n "$OS_VERSION" ]; then
-    found=0
-    IFS=$'\n'
-	for l in $(echo "$jsonResult" | jsonValue "os_version"); do
-        l=$(echo "$l" | sed 's/ *$//g' | sed 's/^ *//g')
-		if [ "$l" = "$OS_VERSION" ]; then
-            ((found+=1))
-            if [ "$found" == "$((NCNT+1))" ]
-            then
-	            break
-	    fi
-        fi
-		((INDEX+=1))
-    done
-    if [ $found = 0 ]; then
-        echoRed "Unable to locate matching sensor: $OS_NAME@$OS_VERSION"
-        exit 1
-    fi
-fi
-
-sha=$(echo "$jsonResult" | jsonValue "sha256" "$INDEX" | sed 's/ *$//g' | sed 's/^ *//g')
-file_type=$(echo "$jsonResult" | jsonValue "file_type" "$INDEX" | sed 's/ *$//g' | sed 's/^ *//g')
-name=$(echo "$jsonResult" | jsonValue "name" "$INDEX" | sed 's/ *$//g' | sed 's/^ *//g')
-
-if [ -z "$sha" ]; then
-    echoRed "Unable to identify a sha matching sensor: $OS_NAME@$OS_VERSION"
-    exit 1
-fi
-
-filename="$OUTPUT_DESTINATION/$name.$file_type"
-#clean up our calculated sha
-sha=$(echo $sha | xargs)
-curl -s -L "https://$SSM_HOST/sensors/entities/download-installer/v1?id=$sha" \
-    -H "Authorization: Bearer $CS_FALCON_OAUTH_TOKEN" \
-    -H "User-Agent: $userAgent" \
-    -o "$filename"
-
-echo "Sensor binary output to: $filename"
-
-if [[ "$PACKAGER" == "yum" || "$PACKAGER" == "zypper" ]]
-then
-	rpmInstall $filename $CS_FALCON_CID $CS_INSTALL_PARAMS $CS_INSTALL_TOKEN
-fi
-if [[ "$PACKAGER" == "apt" ]]
-then
-	aptInstall $filename $CS_FALCON_CID $CS_INSTALL_PARAMS $CS_INSTALL_TOKEN
-fi
\ No newline at end of file
+apiDownload || exit 1
+sensorInstall
@@ -0,0 +1,136 @@
+"""Tests of the Linux install script rendering.
+
+    python3 -m unittest test_install_script
+"""
+import os
+import re
+import shutil
+import subprocess
+import unittest
+from types import SimpleNamespace
+
+from install_script import (
+    INSTALL_SCRIPT_TEMPLATE,
+    LINUX_PLATFORMS,
+    linux_platform_facts,
+    render_install_script,
+)
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), INSTALL_SCRIPT_TEMPLATE)
+SENSOR = {
+    "SENSOR_FILE": "falcon-sensor-7.19.0-17900.amzn2.aarch64.rpm",
+    "SENSOR_SHA256": "0" * 64,
+}
+
+
+def mapping(name, major_version, arch_type, **extras):
+    """Return an agent_list.json linux entry as parsed by MappingIndex."""
+    return SimpleNamespace(
+        os_type="linux",
+        dir=f"CS_{name.upper()}_{arch_type}",
+        name=name,
+        major_version=major_version,
+        arch_type=arch_type,
+        extras=extras,
+    )
+
+
+class LinuxPlatformFactsTest(unittest.TestCase):
+    """linux_platform_facts()"""
+
+    def test_platform_facts(self):
+        facts = linux_platform_facts(mapping("amazon", "2", "arm64"), SENSOR)
+        self.assertEqual(facts["OS_IDS"], "amzn")
+        self.assertEqual(facts["OS_MAJOR_VERSION"], "2")
+        self.assertEqual(facts["OS_ARCH"], "aarch64")
+        self.assertEqual(facts["PACKAGER"], "yum")
+        self.assertEqual(facts["SENSOR_SHA256"], SENSOR["SENSOR_SHA256"])
+        self.assertEqual(facts["MIRROR_S3_URL"], "")
+
+    def test_any_major_version_matches_every_release(self):
+        for name in ("ubuntu", "debian"):
+            facts = linux_platform_facts(mapping(name, "_any", "x86_64"), SENSOR)
+            self.assertEqual(facts["OS_MAJOR_VERSION"], "")
+            self.assertEqual(facts["PACKAGER"], "apt")
+
+    def test_install_tool_overrides_packager(self):
+        facts = linux_platform_facts(
+            mapping("suse", "15", "x86_64", install_tool="rpm"), SENSOR
+        )
+        self.assertEqual(facts["PACKAGER"], "rpm")
+
+    def test_mirror_values(self):
+        sensor = dict(SENSOR, MIRROR_REGION="us-east-1", MIRROR_S3_URL="s3://bucket/key")
+        facts = linux_platform_facts(mapping("redhat", "9", "x86_64"), sensor)
+        self.assertEqual(facts["MIRROR_REGION"], "us-east-1")
+        self.assertEqual(facts["MIRROR_S3_URL"], "s3://bucket/key")
+
+    def test_sensor_is_required(self):
+        for sensor in (None, {}, {"SENSOR_FILE": "x.rpm", "SENSOR_SHA256": ""}):
+            with self.assertRaises(ValueError):
+                linux_platform_facts(mapping("amazon", "2", "x86_64"), sensor)
+
+    def test_unknown_platform(self):
+        with self.assertRaises(ValueError):
+            linux_platform_facts(mapping("gentoo", "_any", "x86_64"), SENSOR)
+
+
+class RenderInstallScriptTest(unittest.TestCase):
+    """render_install_script()"""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(TEMPLATE_PATH, "r", encoding="utf-8") as template_file:
+            cls.template = template_file.read()
+
+    def test_values_are_shell_quoted(self):
+        script = render_install_script(
+            "# @PLATFORM@\nOS_IDS=@OS_IDS@\nSENSOR_FILE=@SENSOR_FILE@\n",
+            {"PLATFORM": "suse 15 x86_64", "OS_IDS": "sles sles_sap",
+             "SENSOR_FILE": "it's.rpm"},
+        )
+        self.assertEqual(
+            script,
+            "# suse 15 x86_64\nOS_IDS='sles sles_sap'\nSENSOR_FILE='it'\"'\"'s.rpm'\n",
+        )
+
+    def test_unfilled_placeholder(self):
+        with self.assertRaises(ValueError):
+            render_install_script("OS_IDS=@OS_IDS@\nOS_ARCH=@OS_ARCH@\n", {"OS_IDS": "amzn"})
+        with self.assertRaises(ValueError):
+            render_install_script("# @PLATFORM@ @OS_IDS@\n", {"OS_IDS": "amzn"})
+
+    def test_every_platform_renders(self):
+        for name in LINUX_PLATFORMS:
+            script = render_install_script(
+                self.template, linux_platform_facts(mapping(name, "_any", "x86_64"), SENSOR)
+            )
+            self.assertIsNone(re.search(r"@[A-Z_]+@", script), name)
+            self.assertIn(f"SENSOR_SHA256={SENSOR['SENSOR_SHA256']}", script)
+
+    def test_every_packager_has_an_install_branch(self):
+        # yum is the default branch, which also covers an install_tool of rpm
+        for _, packager in LINUX_PLATFORMS.values():
+            if packager != "yum":
+                self.assertIn(f"{packager} )\n           {packager}Install ", self.template)
+
+    def test_script_does_not_query_installers(self):
+        script = render_install_script(
+            self.template, linux_platform_facts(mapping("ubuntu", "_any", "arm64"), SENSOR)
+        )
+        self.assertNotIn("sensors/combined/installers", script)
+        self.assertIn("verifyTarget || exit 1", script)
+
+    @unittest.skipIf(shutil.which("bash") is None, "bash is not installed")
+    def test_rendered_script_is_valid_bash(self):
+        script = render_install_script(
+            self.template, linux_platform_facts(mapping("amazon", "2", "arm64"), SENSOR)
+        )
+        result = subprocess.run(
+            ["bash", "-n"], input=script, capture_output=True, text=True, check=False
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""End to end tests of packager.py --mirror against the local backend.
+
+    python3 -m pytest test_packager.py
+"""
+import json
+import os
+import runpy
+import shutil
+import sys
+
+import pytest
+
+pytest.importorskip("boto3")
+
+import _bootstrap  # pylint: disable=C0413,W0611
+from distributor import backends  # pylint: disable=C0413
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGION = "us-east-1"
+BUCKET = "test-bucket"
+PACKAGE_NAME = "CrowdStrike-FalconSensor"
+
+
+@pytest.fixture
+def run_packager(tmp_path, monkeypatch):
+    """Run packager.py from a copy of the layout against the local backend.
+
+    :return: Function running packager.py and returning the keys it uploaded
+    """
+    workdir = tmp_path / "package"
+    shutil.copytree(
+        PACKAGE_DIR,
+        workdir,
+        ignore=shutil.ignore_patterns("__pycache__", "s3-bucket", "local-backend", ".*"),
+    )
+    monkeypatch.chdir(workdir)
+    monkeypatch.setenv("LOCAL_FALCON_INSTALLER_SIZE", "4096")
+    root = tmp_path / "local-backend"
+    uploads = []
+    put_object = backends.LocalS3Client.put_object
+
+    def record(self, Bucket, Key, Body):  # pylint: disable=C0103
+        uploads.append(Key)
+        return put_object(self, Bucket, Key, Body)
+
+    monkeypatch.setattr(backends.LocalS3Client, "put_object", record)
+
+    def run(*argv):
+        uploads.clear()
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            ["packager.py", "--backend", "local", "--local_root", str(root),
+             "-r", REGION, "-b", BUCKET, *argv],
+        )
+        runpy.run_path("packager.py", run_name="__main__")
+        return list(uploads)
+
+    return run
+
+
+def default_manifest():
+    """Return the manifest of the default version of the package."""
+    document = backends.client("ssm", REGION).get_document(Name=PACKAGE_NAME)
+    return json.loads(document["Content"])
+
+
+def test_mirrored_sensors_are_kept_in_the_manifest(run_packager, capsys):
+    uploads = run_packager("--mirror")
+    assert "Mirroring" in capsys.readouterr().out
+    mirrored = {key for key in uploads if key.startswith("falcon/sensors/")}
+    assert mirrored
+    sensors = {
+        file: details
+        for file, details in default_manifest()["files"].items()
+        if file.startswith("sensors/")
+    }
+    assert {"falcon/" + file for file in sensors} == mirrored
+
+    uploads = run_packager("--mirror")
+    assert "Mirroring" not in capsys.readouterr().out
+    assert not [key for key in uploads if key.startswith("falcon/sensors/")]
+    assert {
+        file: details
+        for file, details in default_manifest()["files"].items()
+        if file.startswith("sensors/")
+    } == sensors
+
+
+def test_pinned_sensors_are_not_mirrored(run_packager, capsys):
+    uploads = run_packager()
+    assert "Mirroring" not in capsys.readouterr().out
+    assert not [key for key in uploads if key.startswith("falcon/sensors/")]
+    assert not [file for file in default_manifest()["files"] if file.startswith("sensors/")]
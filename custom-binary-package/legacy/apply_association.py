@@ -7,11 +7,33 @@
 
 Creation date: 01.24.22 - jshcodes@CrowdStrike
 
+Re-applies every association of the SSM document in each of the given
+regions, and optionally in other accounts through assumed roles, then
+waits for the association executions and prints a summary.
+
+By default the associations are only started, as they are configured.
+With --target_concurrency or --target_errors, each association is first
+updated with these rate controls, so SSM runs it on a few of its targets
+at a time. The update is permanent: the new MaxConcurrency and MaxErrors
+stay on the association for its scheduled runs, and are not restored
+after the rollout.
+
+Associations can also be rolled out in waves (--wave_size). A wave starts
+when fewer than --max_concurrency associations are still executing and no
+more than --max_errors associations have failed.
+
 Requirements: boto3
 """
+import sys
 from argparse import ArgumentParser, RawTextHelpFormatter
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 
+import boto3
+from association_rollout import (
+    FAILED_STATUSES,
+    RolloutScheduler,
+    list_association_ids,
+)
 
 def parse_command_line() -> object:
     """Parse the command line for inbound configuration parameters."""
@@ -21,8 +43,8 @@ def parse_command_line() -> object:
         )
     parser.add_argument(
         '-r',
-        '--region',
-        help='AWS Region where association resides.',
+        '--regions',
+        help='Comma separated list of AWS Regions where associations reside.',
         required=True
         )
     parser.add_argument(
@@ -31,30 +53,162 @@ def parse_command_line() -> object:
         help='SSM Document Name',
         required=True
         )
+    parser.add_argument(
+        '-a',
+        '--role_arns',
+        help='Comma separated list of IAM role ARNs to assume in other accounts.\n'
+             'The current credentials are used when not provided.',
+        default=None
+        )
+    parser.add_argument(
+        '-w',
+        '--max_workers',
+        help='Number of account / region pairs processed concurrently.',
+        type=int,
+        default=8
+        )
+    parser.add_argument(
+        '-t',
+        '--timeout',
+        help='Seconds to wait for association executions to finish (0 to skip waiting).',
+        type=int,
+        default=600
+        )
+    parser.add_argument(
+        '-i',
+        '--poll_interval',
+        help='Seconds between association execution status checks.',
+        type=int,
+        default=15
+        )
+    parser.add_argument(
+        '--wave_size',
+        help='Associations started per wave in each region (0 starts all at once).\n'
+             'Needs a --timeout, since each wave waits for the previous ones.',
+        type=int,
+        default=0
+        )
+    parser.add_argument(
+        '--max_concurrency',
+        help='Associations allowed to execute at the same time in each region.\n'
+             'Defaults to the wave size, so each wave waits for the previous one.',
+        type=int,
+        default=0
+        )
+    parser.add_argument(
+        '--max_errors',
+        help='Failed associations tolerated before the rollout halts, as a count\n'
+             'or a percentage, e.g. 0 or 10%%.',
+        default='100%'
+        )
+    parser.add_argument(
+        '--target_concurrency',
+        help='MaxConcurrency set on each association before it is re-applied: the\n'
+             'targets that run it at the same time, as a count or a percentage,\n'
+             'e.g. 10%%. The setting stays on the association. The association\'s\n'
+             'own setting is kept when not provided.',
+        default=None
+        )
+    parser.add_argument(
+        '--target_errors',
+        help='MaxErrors set on each association before it is re-applied: the failed\n'
+             'targets before SSM stops it, as a count or a percentage. The setting\n'
+             'stays on the association. The association\'s own setting is kept\n'
+             'when not provided.',
+        default=None
+        )
 
-    return parser.parse_args()
+    parsed = parser.parse_args()
+    if parsed.wave_size and not parsed.timeout:
+        parser.error("--wave_size needs a --timeout to wait for each wave")
+    return parsed
 
 
-# Consume inbound command line parameters
-args = parse_command_line()
+def get_session(role_arn: str = None) -> boto3.Session:
+    """Return a session for the current credentials or the assumed role."""
+    if not role_arn:
+        return boto3.Session()
+    credentials = boto3.client("sts").assume_role(
+        RoleArn=role_arn,
+        RoleSessionName="crowdstrike-apply-association"
+        )["Credentials"]
+    return boto3.Session(
+        aws_access_key_id=credentials["AccessKeyId"],
+        aws_secret_access_key=credentials["SecretAccessKey"],
+        aws_session_token=credentials["SessionToken"]
+        )
+
+
+def apply_target(target: tuple) -> dict:
+    """Re-apply all associations for one account / region pair."""
+    label, ssm_client = target
+    summary = {"target": label, "associations": 0, "statuses": {},
+               "halted": False, "not_started": [], "error": None}
+    try:
+        association_ids = list_association_ids(ssm_client, SSM_DOC_NAME)
+        summary["associations"] = len(association_ids)
+        if not association_ids:
+            return summary
+        summary.update(RolloutScheduler(
+            ssm_client,
+            wave_size=args.wave_size,
+            max_concurrency=args.max_concurrency,
+            max_errors=args.max_errors,
+            poll_interval=POLL_INTERVAL,
+            timeout=TIMEOUT,
+            target_concurrency=args.target_concurrency or None,
+            target_errors=args.target_errors or None
+            ).run(association_ids, label=f"{label}: "))
+    except Exception as err:  # pylint: disable=W0703
+        summary["error"] = str(err)
+    return summary
 
-REGION = args.region
-SSM_DOC_NAME = args.ssm_doc_name
 
-ssm_client = boto3.client("ssm", region_name=REGION)
+def print_summary(summaries: list) -> bool:
+    """Print one line per target, returning False if anything failed."""
+    healthy = True
+    print("\nAssociation summary:")
+    for summary in sorted(summaries, key=lambda item: item["target"]):
+        if summary["error"]:
+            healthy = False
+            print(f"  {summary['target']}: error - {summary['error']}")
+            continue
+        counts = {}
+        for status in summary["statuses"].values():
+            counts[status] = counts.get(status, 0) + 1
+        if summary["halted"] or summary["not_started"]:
+            healthy = False
+            counts["Not started"] = len(summary["not_started"])
+        # Pending executions are only a failure when we waited for them
+        if any(status in FAILED_STATUSES or (status == "Pending" and TIMEOUT > 0)
+               for status in counts):
+            healthy = False
+        details = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+        print(f"  {summary['target']}: {summary['associations']} associations"
+              f"{' - ' + details if details else ''}")
+    return healthy
 
-associations = ssm_client.list_associations(AssociationFilterList=[{
-    "key": "Name",
-    "value": SSM_DOC_NAME
-}])
 
-assoc_id = associations["Associations"][0]["AssociationId"]
+# Consume inbound command line parameters
+args = parse_command_line()
+
+REGIONS = [region.strip() for region in args.regions.split(",")]
+SSM_DOC_NAME = args.ssm_doc_name
+ROLE_ARNS = args.role_arns.split(",") if args.role_arns else [None]
+TIMEOUT = args.timeout
+POLL_INTERVAL = args.poll_interval
 
-start_result = ssm_client.start_associations_once(AssociationIds=[assoc_id])
+# Clients are created up front, boto3 sessions are not safe to share across threads
+targets = []
+for role_arn in ROLE_ARNS:
+    session = get_session(role_arn)
+    account = role_arn.split(":")[4] if role_arn else "current"
+    for region in REGIONS:
+        targets.append((f"{account}/{region}", session.client("ssm", region_name=region)))
 
-req_id = start_result["ResponseMetadata"]["RequestId"]
+with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+    results = list(executor.map(apply_target, targets))
 
-if start_result["ResponseMetadata"]["HTTPStatusCode"] == 200:
-    print(f"Re-applying association to install agent to new instances.\nRequest ID: {req_id}")
-else:
-    print("Unable to re-apply association.")
+if not print_summary(results):
+    print("Unable to re-apply all associations.")
+    sys.exit(1)
@@ -0,0 +1,247 @@
+"""Staged re-application of State Manager associations.
+
+A deployment usually has one association per region that targets every
+tagged instance, so instances can be rate limited per target: when the
+scheduler is given target rate controls, each association gets SSM's own
+MaxConcurrency and MaxErrors through UpdateAssociation before it is
+re-applied, and SSM then runs it on a few targets at a time and stops it
+when too many of them fail. The update is permanent, the association keeps
+the new rate controls for its scheduled runs. Without target rate controls
+the associations are only started.
+
+On top of that, RolloutScheduler starts associations in waves. A wave only
+starts while the number of associations still executing leaves room for
+it and the failed associations so far are within the error threshold.
+
+The scheduler only talks to the SSM client it is given and takes its
+clock and sleep functions as arguments, so it can be driven by a stubbed
+client without waiting in real time.
+
+Requirements: boto3
+"""
+import time
+from collections import deque
+
+# start_associations_once accepts at most 10 association IDs per call
+MAX_START_BATCH = 10
+TERMINAL_STATUSES = ("Success", "Failed", "TimedOut", "Cancelled")
+FAILED_STATUSES = ("Failed", "TimedOut", "Cancelled")
+# UpdateAssociation clears the optional parameters it is not given, so the
+# current values of these are passed back with the new rate controls
+ASSOCIATION_FIELDS = (
+    "Name",
+    "DocumentVersion",
+    "Parameters",
+    "Targets",
+    "TargetMaps",
+    "TargetLocations",
+    "ScheduleExpression",
+    "ScheduleOffset",
+    "Duration",
+    "OutputLocation",
+    "AssociationName",
+    "AutomationTargetParameterName",
+    "MaxErrors",
+    "MaxConcurrency",
+    "ComplianceSeverity",
+    "SyncCompliance",
+    "ApplyOnlyAtCronInterval",
+    "CalendarNames",
+    "AlarmConfiguration",
+)
+
+
+def list_association_ids(ssm_client, doc_name: str) -> list:
+    """Return the IDs of every association of the document, across all pages."""
+    paginator = ssm_client.get_paginator("list_associations")
+    association_ids = []
+    for page in paginator.paginate(AssociationFilterList=[{
+        "key": "Name",
+        "value": doc_name
+    }]):
+        association_ids.extend(
+            association["AssociationId"] for association in page["Associations"]
+            )
+    return association_ids
+
+
+def start_associations(ssm_client, association_ids: list) -> list:
+    """Start the associations in batches, returning the request IDs."""
+    request_ids = []
+    for index in range(0, len(association_ids), MAX_START_BATCH):
+        start_result = ssm_client.start_associations_once(
+            AssociationIds=association_ids[index:index + MAX_START_BATCH]
+            )
+        request_ids.append(start_result["ResponseMetadata"]["RequestId"])
+    return request_ids
+
+
+def apply_rate_controls(ssm_client, association_id: str,
+                        max_concurrency: str = None, max_errors: str = None) -> bool:
+    """Set the per target rate controls of an association.
+
+    The new values stay on the association, so its scheduled runs keep the
+    same rate controls.
+
+    :param max_concurrency: Targets run at the same time, as a count or a
+        percentage, None keeps the association's value
+    :param max_errors: Failed targets before SSM stops the association, as
+        a count or a percentage, None keeps the association's value
+    :return: True if the update started an execution, which SSM does
+        unless the association only applies at its cron interval
+    """
+    description = ssm_client.describe_association(
+        AssociationId=association_id
+        )["AssociationDescription"]
+    kwargs = {
+        field: description[field] for field in ASSOCIATION_FIELDS if field in description
+        }
+    if max_concurrency:
+        kwargs["MaxConcurrency"] = str(max_concurrency)
+    if max_errors:
+        kwargs["MaxErrors"] = str(max_errors)
+    ssm_client.update_association(AssociationId=association_id, **kwargs)
+    return not description.get("ApplyOnlyAtCronInterval", False)
+
+
+def latest_execution_id(ssm_client, association_id: str) -> str:
+    """Return the ID of the latest execution of the association, or None."""
+    executions = ssm_client.describe_association_executions(
+        AssociationId=association_id,
+        MaxResults=1
+        )["AssociationExecutions"]
+    return executions[0]["ExecutionId"] if executions else None
+
+
+def latest_execution_status(ssm_client, association_id: str,
+                            previous_execution_id: str = None) -> str:
+    """Return the status of the first execution after previous_execution_id.
+
+    Executions are told apart by ID rather than by their CreatedTime, which
+    would have to be compared with the local clock.
+    """
+    executions = ssm_client.describe_association_executions(
+        AssociationId=association_id,
+        MaxResults=1
+        )["AssociationExecutions"]
+    if not executions or executions[0]["ExecutionId"] == previous_execution_id:
+        return "Pending"
+    return executions[0]["Status"]
+
+
+def allowed_errors(max_errors: str, total: int) -> int:
+    """Convert an SSM style error threshold ("3" or "10%") to a count."""
+    max_errors = str(max_errors).strip()
+    if max_errors.endswith("%"):
+        return int(total * float(max_errors[:-1]) / 100)
+    return int(max_errors)
+
+
+class RolloutScheduler:  # pylint: disable=R0902, R0903
+    """Start associations in waves, gated on concurrency and errors."""
+
+    def __init__(self, ssm_client, wave_size=0, max_concurrency=0,  # pylint: disable=R0913
+                 max_errors="100%", poll_interval=15, timeout=600,
+                 clock=time.time, sleep=time.sleep,
+                 target_concurrency=None, target_errors=None):
+        """
+        :param ssm_client: The boto3 SSM client, or a stub with the same methods
+        :param wave_size: Associations started per wave, 0 for a single wave
+        :param max_concurrency: Associations allowed to execute at the same
+            time, defaults to the wave size
+        :param max_errors: Failed associations tolerated before the rollout
+            halts, as a count or a percentage of all associations
+        :param poll_interval: Seconds between association status checks
+        :param timeout: Seconds before the rollout stops waiting, 0 starts
+            every wave at once without waiting
+        :param clock: Function returning the current time in seconds
+        :param sleep: Function used to wait between status checks
+        :param target_concurrency: MaxConcurrency set on each association
+            before it is re-applied, None keeps the association's value
+        :param target_errors: MaxErrors set on each association before it is
+            re-applied, None keeps the association's value
+        """
+        self.ssm_client = ssm_client
+        self.wave_size = wave_size
+        self.max_concurrency = max_concurrency
+        self.max_errors = max_errors
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.target_concurrency = target_concurrency
+        self.target_errors = target_errors
+
+    def run(self, association_ids: list, label: str = "") -> dict:
+        """Roll the associations out, returning their statuses.
+
+        :param association_ids: The associations to re-apply
+        :param label: Prefix for progress messages
+        :return: {"statuses": {id: status}, "halted": bool, "not_started": [ids]}
+        """
+        # Waves are gated on the executions, which are not waited for without a timeout
+        wave_size = (self.timeout and self.wave_size) or len(association_ids) or 1
+        max_concurrency = max(self.max_concurrency or wave_size, wave_size)
+        error_limit = allowed_errors(self.max_errors, len(association_ids))
+        waves = deque(
+            association_ids[index:index + wave_size]
+            for index in range(0, len(association_ids), wave_size)
+            )
+        statuses = {}
+        previous_executions = {}
+        halted = False
+        deadline = self.clock() + self.timeout
+        wave_number = 0
+
+        while True:
+            in_flight = [
+                association_id for association_id in previous_executions
+                if statuses[association_id] not in TERMINAL_STATUSES
+                ]
+            failed = sum(status in FAILED_STATUSES for status in statuses.values())
+            if failed > error_limit and not halted:
+                halted = True
+                print(f"{label}{failed} associations failed, halting rollout "
+                      f"with {sum(len(wave) for wave in waves)} not started.")
+
+            while (waves and not halted
+                   and len(in_flight) + len(waves[0]) <= max_concurrency):
+                wave = waves.popleft()
+                wave_number += 1
+                for association_id in wave:
+                    previous_executions[association_id] = latest_execution_id(
+                        self.ssm_client, association_id
+                        )
+                    statuses[association_id] = "Pending"
+                request_ids = self._start(wave)
+                in_flight.extend(wave)
+                print(f"{label}wave {wave_number}: re-applying {len(wave)} associations.\n"
+                      f"Request IDs: {', '.join(request_ids) or 'none, started by the update'}")
+
+            if not in_flight and (halted or not waves):
+                break
+            if self.clock() >= deadline:
+                break
+            self.sleep(self.poll_interval)
+            for association_id in in_flight:
+                statuses[association_id] = latest_execution_status(
+                    self.ssm_client, association_id, previous_executions[association_id]
+                    )
+
+        return {
+            "statuses": statuses,
+            "halted": halted,
+            "not_started": [association_id for wave in waves for association_id in wave],
+        }
+
+    def _start(self, wave: list) -> list:
+        """Re-apply the associations of a wave, returning the request IDs."""
+        if not (self.target_concurrency or self.target_errors):
+            return start_associations(self.ssm_client, wave)
+        # Updating the rate controls re-applies the association by itself
+        not_started = [
+            association_id for association_id in wave
+            if not apply_rate_controls(self.ssm_client, association_id,
+                                       self.target_concurrency, self.target_errors)
+            ]
+        return start_associations(self.ssm_client, not_started)
@@ -0,0 +1,180 @@
+"""Tests of the association rollout scheduler against a stubbed SSM client.
+
+    python3 -m unittest test_association_rollout
+"""
+import unittest
+
+from association_rollout import RolloutScheduler, apply_rate_controls
+
+
+class StubSSMClient:
+    """SSM client stub whose executions finish after a number of polls."""
+
+    def __init__(self, associations, polls_to_finish=2, failing=()):
+        """
+        :param associations: {association ID: AssociationDescription}
+        :param polls_to_finish: Status checks before an execution finishes
+        :param failing: Association IDs whose executions fail
+        """
+        self.associations = associations
+        self.polls_to_finish = polls_to_finish
+        self.failing = set(failing)
+        self.executions = {association_id: [] for association_id in associations}
+        self.calls = []
+        # Executions still in progress whenever associations were started
+        self.in_progress_at_start = []
+
+    def describe_association(self, AssociationId):  # pylint: disable=C0103
+        self.calls.append(("describe_association", AssociationId))
+        return {"AssociationDescription": dict(self.associations[AssociationId])}
+
+    def update_association(self, AssociationId, **kwargs):  # pylint: disable=C0103
+        self.calls.append(("update_association", AssociationId))
+        self.associations[AssociationId] = dict(kwargs, AssociationId=AssociationId)
+        if not kwargs.get("ApplyOnlyAtCronInterval"):
+            self._execute(AssociationId)
+        return {"AssociationDescription": self.associations[AssociationId]}
+
+    def start_associations_once(self, AssociationIds):  # pylint: disable=C0103
+        self.calls.append(("start_associations_once", tuple(AssociationIds)))
+        self.in_progress_at_start.append(sum(
+            executions[-1]["Status"] == "InProgress"
+            for executions in self.executions.values() if executions
+            ))
+        for association_id in AssociationIds:
+            self._execute(association_id)
+        return {"ResponseMetadata": {"RequestId": f"request-{len(self.calls)}"}}
+
+    def describe_association_executions(self, AssociationId, MaxResults):  # pylint: disable=C0103
+        executions = self.executions[AssociationId]
+        if executions and executions[-1]["Status"] == "InProgress":
+            execution = executions[-1]
+            execution["polls"] += 1
+            if execution["polls"] > self.polls_to_finish:
+                execution["Status"] = (
+                    "Failed" if AssociationId in self.failing else "Success"
+                    )
+        return {"AssociationExecutions": [
+            {"ExecutionId": execution["ExecutionId"], "Status": execution["Status"]}
+            for execution in reversed(executions[-MaxResults:])
+            ]}
+
+    def started(self):
+        """Association IDs in the order they were re-applied."""
+        order = []
+        for call, argument in self.calls:
+            if call == "start_associations_once":
+                order.extend(argument)
+            elif call == "update_association":
+                order.append(argument)
+        return order
+
+    def _execute(self, association_id):
+        executions = self.executions[association_id]
+        executions.append({
+            "ExecutionId": f"{association_id}-{len(executions) + 1}",
+            "Status": "InProgress",
+            "polls": 0,
+            })
+
+
+def association(association_id, **fields):
+    """Return an AssociationDescription as returned by describe_association."""
+    description = {
+        "AssociationId": association_id,
+        "Name": "CrowdStrike-FalconSensorDeploy",
+        "Targets": [{"Key": "tag:SENSOR_DEPLOY", "Values": ["TRUE"]}],
+        "ScheduleExpression": "rate(30 minutes)",
+        "MaxConcurrency": "100%",
+        "MaxErrors": "25%",
+        "AutomationTargetParameterName": "InstanceIds",
+        }
+    description.update(fields)
+    return description
+
+
+class RolloutSchedulerTest(unittest.TestCase):
+    """RolloutScheduler with a fake clock and a stubbed SSM client."""
+
+    def setUp(self):
+        self.now = 0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def scheduler(self, ssm_client, **kwargs):
+        return RolloutScheduler(ssm_client, poll_interval=1, clock=self.clock,
+                                sleep=self.sleep, **kwargs)
+
+    def test_waves_wait_for_the_previous_wave(self):
+        ssm_client = StubSSMClient({f"a{index}": association(f"a{index}") for index in range(5)})
+        result = self.scheduler(ssm_client, wave_size=2, timeout=60).run(
+            sorted(ssm_client.associations)
+            )
+        self.assertEqual(set(result["statuses"].values()), {"Success"})
+        self.assertEqual(result["not_started"], [])
+        starts = [argument for call, argument in ssm_client.calls
+                  if call == "start_associations_once"]
+        self.assertEqual(starts, [("a0", "a1"), ("a2", "a3"), ("a4",)])
+        # Each wave starts only once the executions of the previous one finished
+        self.assertEqual(ssm_client.in_progress_at_start, [0, 0, 0])
+        # Without target rate controls the associations are left as configured
+        self.assertNotIn("update_association", [call for call, _ in ssm_client.calls])
+
+    def test_halts_when_errors_exceed_threshold(self):
+        ssm_client = StubSSMClient(
+            {f"a{index}": association(f"a{index}") for index in range(4)}, failing={"a0"}
+            )
+        result = self.scheduler(ssm_client, wave_size=1, max_errors="0", timeout=60).run(
+            sorted(ssm_client.associations)
+            )
+        self.assertTrue(result["halted"])
+        self.assertEqual(result["statuses"], {"a0": "Failed"})
+        self.assertEqual(result["not_started"], ["a1", "a2", "a3"])
+
+    def test_rate_controls_limit_targets(self):
+        ssm_client = StubSSMClient({
+            "a0": association("a0"),
+            "a1": association("a1", ApplyOnlyAtCronInterval=True),
+            })
+        result = self.scheduler(ssm_client, timeout=60, target_concurrency="10%",
+                                target_errors="5").run(["a0", "a1"])
+        self.assertEqual(result["statuses"], {"a0": "Success", "a1": "Success"})
+        for association_id in ("a0", "a1"):
+            updated = ssm_client.associations[association_id]
+            self.assertEqual(updated["MaxConcurrency"], "10%")
+            self.assertEqual(updated["MaxErrors"], "5")
+            # The other optional parameters are passed back, not cleared
+            self.assertEqual(updated["Targets"], association(association_id)["Targets"])
+            self.assertEqual(updated["ScheduleExpression"], "rate(30 minutes)")
+        # The update re-applies a0, a1 only applies at its cron interval
+        self.assertIn(("start_associations_once", ("a1",)), ssm_client.calls)
+        self.assertEqual(len(ssm_client.executions["a0"]), 1)
+
+    def test_apply_rate_controls_keeps_unset_values(self):
+        ssm_client = StubSSMClient({"a0": association("a0")})
+        self.assertTrue(apply_rate_controls(ssm_client, "a0", max_concurrency="2"))
+        self.assertEqual(ssm_client.associations["a0"]["MaxConcurrency"], "2")
+        self.assertEqual(ssm_client.associations["a0"]["MaxErrors"], "25%")
+
+    def test_previous_execution_is_not_mistaken_for_the_new_one(self):
+        ssm_client = StubSSMClient({"a0": association("a0")}, polls_to_finish=3)
+        ssm_client.executions["a0"].append(
+            {"ExecutionId": "old", "Status": "Failed", "polls": 0}
+            )
+        result = self.scheduler(ssm_client, timeout=60).run(["a0"])
+        self.assertEqual(result["statuses"], {"a0": "Success"})
+
+    def test_no_timeout_starts_every_wave(self):
+        ssm_client = StubSSMClient({f"a{index}": association(f"a{index}") for index in range(3)})
+        result = self.scheduler(ssm_client, wave_size=1, timeout=0).run(["a0", "a1", "a2"])
+        self.assertEqual(result["not_started"], [])
+        self.assertEqual(ssm_client.started(), ["a0", "a1", "a2"])
+        self.assertEqual(ssm_client.calls[-1], ("start_associations_once", ("a0", "a1", "a2")))
+
+
+if __name__ == "__main__":
+    unittest.main()
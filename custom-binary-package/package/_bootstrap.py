@@ -0,0 +1,15 @@
+"""Make the packaging engine importable from this layout's scripts.
+
+The engine is the distributor package at the root of the repository,
+shared by the custom package layouts. Import this module before it:
+
+    import _bootstrap  # pylint: disable=W0611
+    from distributor import backends
+"""
+import os
+import sys
+
+REPOSITORY_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+if REPOSITORY_ROOT not in sys.path:
+    sys.path.insert(0, REPOSITORY_ROOT)
@@ -0,0 +1,84 @@
+"""Fixtures running the custom-binary scripts against the local backend."""
+import json
+import os
+import runpy
+import shutil
+import sys
+
+import pytest
+
+import _bootstrap  # pylint: disable=W0611
+
+try:
+    from distributor import backends
+except ImportError:  # boto3 is not installed
+    backends = None
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGION = "us-east-1"
+BUCKET = "test-bucket"
+PACKAGE_NAME = "CrowdStrike-FalconSensor"
+
+
+@pytest.fixture
+def local_root(tmp_path, monkeypatch):
+    """Copy of the layout as the working directory, and the local backend root."""
+    if backends is None:
+        pytest.skip("boto3 is not installed")
+    workdir = tmp_path / "package"
+    shutil.copytree(
+        PACKAGE_DIR,
+        workdir,
+        ignore=shutil.ignore_patterns(
+            "__pycache__", "build", "sensor-cache", "s3-bucket", "local-backend", ".*"
+        ),
+    )
+    monkeypatch.chdir(workdir)
+    monkeypatch.setenv("LOCAL_FALCON_INSTALLER_SIZE", "4096")
+    root = tmp_path / "local-backend"
+    backends.configure("local", str(root))
+    return root
+
+
+@pytest.fixture
+def run_script(local_root, monkeypatch):
+    """Run a script of the layout against the local backend."""
+
+    def run(script, *argv):
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            [script, "--backend", "local", "--local_root", str(local_root),
+             "-r", REGION, "-b", BUCKET, *argv],
+        )
+        runpy.run_path(script, run_name="__main__")
+
+    return run
+
+
+@pytest.fixture
+def uploads(local_root, monkeypatch):  # pylint: disable=W0613
+    """Keys of the objects put to the local S3 fake."""
+    keys = []
+    put_object = backends.LocalS3Client.put_object
+
+    def record(self, Bucket, Key, Body):  # pylint: disable=C0103
+        keys.append(Key)
+        return put_object(self, Bucket, Key, Body)
+
+    monkeypatch.setattr(backends.LocalS3Client, "put_object", record)
+    return keys
+
+
+@pytest.fixture
+def published(local_root):
+    """Return the document versions and the default manifest of the package."""
+
+    def versions():
+        backends.configure("local", str(local_root))
+        ssm_client = backends.client("ssm", REGION)
+        document_versions = ssm_client.list_document_versions(Name=PACKAGE_NAME)
+        default = ssm_client.get_document(Name=PACKAGE_NAME)
+        return document_versions["DocumentVersions"], json.loads(default["Content"])
+
+    return versions
@@ -1,19 +1,82 @@
 import argparse
-from genericpath import exists
+import atexit
+import hashlib
 import os
-from re import split
-import resource
 import shutil
-import subprocess
-from urllib.request import urlretrieve
+from concurrent.futures import ThreadPoolExecutor
+
+import _bootstrap  # pylint: disable=W0611
+from distributor import backends
+from distributor.checkpoint import CheckpointJournal
+from distributor.packager import (
+    PATH_TO_BUCKET_FOLDER,
+    DistributorPackager,
+    S3BucketUpdater,
+    SSMPackageUpdater,
+    publish_package,
+    remove_local_copies,
+)
+from distributor.profiling import StageProfiler
+from platforms import download_plan, mapping_index, select_platforms
+
+BUILD_DIR = "./build"
+SENSOR_CACHE_DIR = "./sensor-cache"
+MAX_DOWNLOAD_WORKERS = 4
+CHECKPOINT_FILE = "./.create-package.checkpoint"
+
+
+def version_key(version):
+    """Sort key for a sensor version string such as 7.10.17706."""
+    return tuple(int(part) if part.isdigit() else 0 for part in version.split("."))
+
+
+def release_digest(sensor_set):
+    """Short digest of the sha256s of a release's sensors."""
+    return hashlib.sha256(",".join(sensor_set).encode("utf-8")).hexdigest()[:8]
+
+
+def falcon_command(action, **params):
+    """Call the Falcon API, ending the run with a message if it cannot be used."""
+    try:
+        return falcon.command(action=action, **params)
+    except backends.FalconAPIError as err:
+        raise SystemExit(str(err)) from err
+
+
+def download_sensor(sha):
+    """Download a sensor installer into the cache, once per sha256."""
+    cache_path = os.path.join(SENSOR_CACHE_DIR, sha)
+    if journal.verified("download", sha, cache_path, sha256=sha):
+        return cache_path
+    download = falcon_command("DownloadSensorInstallerById", id=sha)
+    if isinstance(download, dict):
+        raise SystemExit("Unable to download requested sensor.")
+    if hashlib.sha256(download).hexdigest() != sha:
+        raise SystemExit(f"Downloaded sensor {sha} does not match its sha256.")
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as save_file:
+        save_file.write(download)
+    os.replace(tmp_path, cache_path)
+    journal.record("download", sha, sha256=sha)
+    return cache_path
+
+
+def stage_binary(version_dir, binary, cache_path):
+    """Lay out a package directory with the installer and its scripts."""
+    sensor_path = os.path.join(version_dir, binary["path"])
+    os_dir = os.path.dirname(sensor_path)
+    os.makedirs(os_dir, exist_ok=True)
+    # A resumed run stages into the build directory of the interrupted one
+    if os.path.lexists(sensor_path):
+        os.remove(sensor_path)
+    try:
+        os.link(cache_path, sensor_path)
+    except OSError:
+        shutil.copyfile(cache_path, sensor_path)
+    shutil.copytree(
+        f"./scripts/{binary['installer']}", f"{os_dir}/", dirs_exist_ok=True
+    )
 
-try:
-    from falconpy import APIHarness
-except ImportError as no_falconpy:
-    raise SystemExit(
-        "The CrowdStrike SDK must be installed in order to use this utility.\n"
-        "Install this application with the command `python3 -m pip install crowdstrike-falconpy`."
-    ) from no_falconpy
 
 parser = argparse.ArgumentParser(
     prog="create-package",
@@ -38,192 +101,222 @@ parser.add_argument(
     help="The name of the distributor package to create.",
     default="CrowdStrike-FalconSensor",
 )
+parser.add_argument(
+    "-n",
+    "--sensor_versions",
+    help="A comma separated list of N-minus sensor versions to build, e.g. 0,1,2 for N, N-1 and N-2. "
+    "The first entry is published as the default version.",
+    default="1",
+)
+parser.add_argument(
+    "--platforms",
+    help="A comma separated list of package directory patterns to build, e.g. '*ARM64'. "
+    "Other platforms are kept as published in the default version of the existing distributor package, "
+    "so only one --sensor_versions entry can be built.",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="Continue an interrupted run from its checkpoint. Downloaded sensors, built zips, "
+    "uploaded objects and published versions are verified by checksum and not repeated.",
+)
+parser.add_argument(
+    "--backend",
+    choices=backends.BACKENDS,
+    default="aws",
+    help="Use AWS and the Falcon API, or local fakes of S3, SSM and the Falcon API for offline runs.",
+)
+parser.add_argument(
+    "--local_root",
+    default=backends.LOCAL_ROOT,
+    help="Directory holding the state of the local backend.",
+)
+parser.add_argument(
+    "--profile",
+    metavar="DIR",
+    help="Write a cProfile of each stage of the run, its tracemalloc and RSS peaks, "
+    "and a summary.json to this directory.",
+)
 
 args = parser.parse_args()
+backends.configure(args.backend, args.local_root)
+profiler = StageProfiler(args.profile)
+atexit.register(profiler.close)
 
 client_id = os.environ.get("FALCON_CLIENT_ID")
 client_secret = os.environ.get("FALCON_CLIENT_SECRET")
 
-if not client_id:
+if not client_id and not backends.is_local():
     raise ValueError("FALCON_CLIENT_ID environment variable not set.")
 
-if not client_secret:
+if not client_secret and not backends.is_local():
     raise ValueError("FALCON_CLIENT_SECRET environment variable not set.")
 
-dirs_to_delete = []
-
-python_executable = shutil.which("python3")
+try:
+    n_minus_list = [int(n) for n in args.sensor_versions.split(",")]
+except ValueError as bad_version:
+    raise SystemExit(
+        f"Invalid --sensor_versions value: {args.sensor_versions}"
+    ) from bad_version
 
-if not python_executable:
-    python_executable = "python"
+# The other platforms are carried over from the default version, which only
+# holds the sensors of one N-minus version
+if args.platforms and len(n_minus_list) > 1:
+    raise SystemExit("--platforms can only be used with a single --sensor_versions entry.")
 
-print("Downloading required files...")
+try:
+    platforms = select_platforms(args.platforms)
+except ValueError as err:
+    raise SystemExit(str(err)) from err
+binary_list = download_plan(platforms)
+platform_index = mapping_index(platforms)
 
-binary_list = [
-    {
-        "filter": "os:'Amazon Linux'+os_version:'2'+platform:'linux'",
-        "path": "CS_AMAZON2_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'Amazon Linux'+os_version:'2 - arm64'+platform:'linux'",
-        "path": "CS_AMAZON2_ARM64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'Amazon Linux'+os_version:'2023'+platform:'linux'",
-        "path": "CS_AMAZON2023_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'Amazon Linux'+os_version:'2023 - arm64'+platform:'linux'",
-        "path": "CS_AMAZON2023_ARM64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'*RHEL*'+os_version:'7'+platform:'linux'",
-        "path": "CS_RHEL7_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
+journal = CheckpointJournal(
+    CHECKPOINT_FILE,
+    resume=args.resume,
+    run_args={
+        "aws_region": args.aws_region,
+        "s3bucket": args.s3bucket,
+        "package_name": args.package_name,
+        "sensor_versions": args.sensor_versions,
+        "platforms": args.platforms,
     },
-    {
-        "filter": "os:'*RHEL*'+os_version:'8'+platform:'linux'",
-        "path": "CS_RHEL8_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'*RHEL*'+os_version:'8 - arm64'+platform:'linux'",
-        "path": "CS_RHEL8_ARM64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'*RHEL*'+os_version:'9'+platform:'linux'",
-        "path": "CS_RHEL9_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "filter": "os:'*RHEL*'+os_version:'9 - arm64'+platform:'linux'",
-        "path": "CS_RHEL9_ARM64/falcon-sensor.rpm",
-        "installer": "yum",
-    },
-    {
-        "path": "CS_CENTOS7_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*CentOS*'+os_version:'7'+platform:'linux'",
-    },
-    {
-        "path": "CS_CENTOS8_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*CentOS*'+os_version:'8'+platform:'linux'",
-    },
-    {
-        "path": "CS_CENTOS8_ARM64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*CentOS*'+os_version:'8 - arm64'+platform:'linux'",
-    },
-    {
-        "path": "CS_ORACLE6_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*Oracle*'+os_version:'6'+platform:'linux'",
-    },
-    {
-        "path": "CS_ORACLE7_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*Oracle*'+os_version:'7'+platform:'linux'",
-    },
-    {
-        "path": "CS_ORACLE8_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*Oracle*'+os_version:'8'+platform:'linux'",
-    },
-    {
-        "path": "CS_ORACLE9_x86_64/falcon-sensor.rpm",
-        "installer": "yum",
-        "filter": "os:'*Oracle*'+os_version:'9'+platform:'linux'",
-    },
-    {
-        "path": "CS_SLES12_x86_64/falcon-sensor.rpm",
-        "installer": "zypper",
-        "filter": "os:'*SLES*'+os_version:'12'+platform:'linux'",
-    },
-    {
-        "path": "CS_SLES15_x86_64/falcon-sensor.rpm",
-        "installer": "zypper",
-        "filter": "os:'*SLES*'+os_version:'15'+platform:'linux'",
-    },
-    {
-        "path": "CS_UBUNTU_x86_64/falcon-sensor.deb",
-        "installer": "dpkg",
-        "filter": "os:'*Ubuntu*'+os_version:'*16/18/20/22*'+os_version:!'*arm64*'+os_version:!~'zLinux'+platform:'linux'",
-    },
-    {
-        "path": "CS_UBUNTU_ARM64/falcon-sensor.deb",
-        "installer": "dpkg",
-        "filter": "os:'*Ubuntu*'+os_version:'*18/20/22*'+os_version:~'arm64'+os_version:!~'zLinux'+platform:'linux'",
-    },
-    {
-        "path": "CS_DEBIAN_x86_64/falcon-sensor.deb",
-        "installer": "dpkg",
-        "filter": "os:'Debian'+os_version:'*9/10/11*'+os_version:!'*arm64*'+platform:'linux'",
-    },
-    {
-        "path": "CS_WINDOWS/WindowsSensor.exe",
-        "installer": "windows",
-        "filter": "os:'Windows'+platform:'windows'",
-    },
-]
-
-falcon = APIHarness(
-    client_id=os.environ.get("FALCON_CLIENT_ID"),
-    client_secret=os.environ.get("FALCON_CLIENT_SECRET"),
 )
-for binary in binary_list:
-    sensors = falcon.command(
-        action="GetCombinedSensorInstallersByQuery",
-        filter=binary["filter"],
-        sort="version.desc",
+
+# Unchanged files are referenced from the live document instead of uploaded again,
+# and a partial rebuild keeps the platforms it does not touch
+with profiler.stage("live_manifest"):
+    live_manifest = SSMPackageUpdater(args.aws_region).get_manifest(args.package_name)
+if args.platforms and live_manifest is None:
+    print(
+        f"Distributor package {args.package_name} does not exist yet, "
+        "only the selected platforms will be published."
     )
-    resources = sensors["body"].get("resources", [])
-    if len(resources) == 0:
-        raise SystemExit(
-            f"Unable to find sensor that matches filter: {binary['filter']}"
-        )
-    if len(resources) > 1:
-        sensor = resources[1]
-    else:
-        sensor = resources[0]
 
-    sha = sensor["sha256"]
-    sensor_os = sensor["os"]
-    sensor_os_version = sensor["os_version"]
-    sensor_name = sensor["name"]
+# One token and one keep-alive connection per download worker
+falcon = backends.falcon_client(client_id, client_secret)
+
+# selections[n_minus] is a list of (binary, sensor) pairs for that version
+selections = {n_minus: [] for n_minus in n_minus_list}
+with profiler.stage("query"):
+    for binary in binary_list:
+        sensors = falcon_command(
+            "GetCombinedSensorInstallersByQuery",
+            filter=binary["filter"],
+            sort="version.desc",
+        )
+        resources = sensors["body"].get("resources", [])
+        if len(resources) == 0:
+            raise SystemExit(
+                f"Unable to find sensor that matches filter: {binary['filter']}"
+            )
+        for n_minus in n_minus_list:
+            sensor = resources[min(n_minus, len(resources) - 1)]
+            selections[n_minus].append((binary, sensor))
 
-    print(f"Downloading {sensor_name} for {sensor_os} {sensor_os_version}")
+unique_shas = {
+    sensor["sha256"]: sensor
+    for selection in selections.values()
+    for _, sensor in selection
+}
+print("Downloading required files...")
+os.makedirs(SENSOR_CACHE_DIR, exist_ok=True)
+for sensor in unique_shas.values():
+    print(
+        f"Downloading {sensor['name']} for {sensor['os']} {sensor['os_version']}"
+    )
+with profiler.stage("download"), ThreadPoolExecutor(
+    max_workers=MAX_DOWNLOAD_WORKERS
+) as executor:
+    cache_paths = dict(zip(unique_shas, executor.map(download_sensor, unique_shas)))
+falcon_stats = falcon.stats()
+print(
+    f"Falcon API: {falcon_stats['requests']} requests over {falcon_stats['connections']} "
+    f"connections ({falcon_stats['reused']} reused), "
+    f"{falcon_stats['token_requests']} token requests"
+)
+falcon.close()
 
-    download = falcon.command(action="DownloadSensorInstallerById", id=sha)
-    if isinstance(download, dict):
-        raise SystemExit("Unable to download requested sensor.")
+# Each N-minus selection is published under the highest sensor version it
+# contains. Platforms with few installers repeat their oldest one, so two
+# selections can share that version with different sensors: a release is
+# identified by its sensors, and named after both.
+releases = {}
+for n_minus in n_minus_list:
+    sensor_set = tuple(sensor["sha256"] for _, sensor in selections[n_minus])
+    version_name = max(
+        (sensor["version"] for _, sensor in selections[n_minus]), key=version_key
+    )
+    release = f"{version_name}-{release_digest(sensor_set)}"
+    if sensor_set in releases:
+        print(f"Skipping N-{n_minus}: same sensors as release {releases[sensor_set].release}")
+        continue
+    release_dir = os.path.join(BUILD_DIR, release)
+    for binary, sensor in selections[n_minus]:
+        stage_binary(release_dir, binary, cache_paths[sensor["sha256"]])
+    # Other releases are compared with the last published version of their sensors
+    release_manifest = live_manifest
+    if releases:
+        with profiler.stage("live_manifest"):
+            release_manifest = SSMPackageUpdater(args.aws_region).get_version_manifest(
+                args.package_name, version_name
+            ) or live_manifest
+    releases[sensor_set] = DistributorPackager(
+        version=version_name,
+        source_dir=release_dir,
+        live_manifest=release_manifest,
+        partial=bool(args.platforms),
+        package_name=args.package_name,
+        release=release,
+    )
 
-    os_dir = os.path.dirname(binary["path"])
-    os.makedirs(os_dir, exist_ok=True)
-    with open(binary["path"], "wb") as save_file:
-        save_file.write(download)
-    shutil.copytree(
-        f"./scripts/{binary['installer']}", f"{os_dir}/", dirs_exist_ok=True
+os.makedirs(PATH_TO_BUCKET_FOLDER, exist_ok=True)
+with profiler.stage("build"), ThreadPoolExecutor(max_workers=len(releases)) as executor:
+    built = list(
+        executor.map(
+            lambda packager: packager.build(
+                platform_index, journal, remove_unchanged=False
+            ),
+            releases.values(),
+        )
     )
-    dirs_to_delete.append(os_dir)
-
-subprocess.check_call(
-    [
-        "python3",
-        "packager.py",
-        "-r",
-        args.aws_region,
-        "-b",
+files = set().union(*built)
+# Versions share zips, drop the unchanged local copies once every build is done
+remove_local_copies(files)
+
+# Zips are named after their content, the bucket may already hold them from another package
+with profiler.stage("upload"):
+    uploaded = S3BucketUpdater(args.aws_region).update(
         args.s3bucket,
-        "-p",
+        files,
+        "falcon/",
+        journal,
+        content_addressed=files - {packager.manifest_file for packager in releases.values()},
+    )
+if not uploaded:
+    raise SystemExit(
+        "Unable to upload all package files, re-run with --resume to retry."
+    )
+print("Package file have been built and uploaded successfully.")
+
+# The default version goes first, a new document makes its first version the default
+with profiler.stage("publish"):
+    publish_package(
         args.package_name,
-    ]
+        [args.aws_region],
+        args.s3bucket,
+        [
+            (packager, packager.content_version_name, index == 0)
+            for index, packager in enumerate(releases.values())
+        ],
+        journal,
+    )
+
+for d in (BUILD_DIR, SENSOR_CACHE_DIR, PATH_TO_BUCKET_FOLDER):
+    shutil.rmtree(d, ignore_errors=True)
+journal.remove()
+print(
+    f"Package {args.package_name} versions "
+    f"{', '.join(packager.content_version_name for packager in releases.values())} "
+    f"created successfully in region {args.aws_region}."
 )
-for d in dirs_to_delete:
-    shutil.rmtree(d)
-print(f"Package {args.package_name} created successfully in region {args.aws_region}.")
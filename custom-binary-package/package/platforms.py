@@ -0,0 +1,375 @@
+"""Declarative platform matrix for the binary distributor package.
+
+Each entry describes one package directory: the manifest platform it
+serves, the Falcon installer query used to download its sensor and the
+install scripts bundled with it. Both the create-package.py download plan
+and agent_list.json are generated from this matrix.
+
+Run this module to regenerate agent_list.json after editing the matrix:
+
+    python3 platforms.py
+"""
+
+import argparse
+import json
+import sys
+from fnmatch import fnmatch
+
+import _bootstrap  # pylint: disable=W0611
+from distributor.mappings import (
+    OS_LIST,
+    MappingIndex,
+    PackageMapping,
+)
+
+AGENT_LIST_FILE = "agent_list.json"
+
+PLATFORM_MATRIX = [
+    {
+        "dir": "CS_AMAZON2_x86_64",
+        "id": "amzn2",
+        "os_type": "linux",
+        "name": "amazon",
+        "major_version": "2",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'Amazon Linux'+os_version:'2'+platform:'linux'",
+    },
+    {
+        "dir": "CS_AMAZON2_ARM64",
+        "id": "amzn2",
+        "os_type": "linux",
+        "name": "amazon",
+        "major_version": "2",
+        "minor_version": "",
+        "arch_type": "arm64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'Amazon Linux'+os_version:'2 - arm64'+platform:'linux'",
+    },
+    {
+        "dir": "CS_AMAZON2023_x86_64",
+        "id": "amzn2023",
+        "os_type": "linux",
+        "name": "amazon",
+        "major_version": "2023",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'Amazon Linux'+os_version:'2023'+platform:'linux'",
+    },
+    {
+        "dir": "CS_AMAZON2023_ARM64",
+        "id": "amzn2023",
+        "os_type": "linux",
+        "name": "amazon",
+        "major_version": "2023",
+        "minor_version": "",
+        "arch_type": "arm64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'Amazon Linux'+os_version:'2023 - arm64'+platform:'linux'",
+    },
+    {
+        "dir": "CS_UBUNTU_x86_64",
+        "id": "ubuntu",
+        "os_type": "linux",
+        "name": "ubuntu",
+        "major_version": "_any",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "dpkg",
+        "sensor_file": "falcon-sensor.deb",
+        "filter": "os:'*Ubuntu*'+os_version:'*16/18/20/22*'+os_version:!'*arm64*'+os_version:!~'zLinux'+platform:'linux'",
+    },
+    {
+        "dir": "CS_DEBIAN_x86_64",
+        "os_type": "linux",
+        "name": "debian",
+        "major_version": "_any",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "dpkg",
+        "sensor_file": "falcon-sensor.deb",
+        "filter": "os:'Debian'+os_version:'*9/10/11*'+os_version:!'*arm64*'+platform:'linux'",
+    },
+    {
+        "dir": "CS_UBUNTU_ARM64",
+        "id": "ubuntu",
+        "os_type": "linux",
+        "name": "ubuntu",
+        "major_version": "_any",
+        "minor_version": "",
+        "arch_type": "arm64",
+        "installer": "dpkg",
+        "sensor_file": "falcon-sensor.deb",
+        "filter": "os:'*Ubuntu*'+os_version:'*18/20/22*'+os_version:~'arm64'+os_version:!~'zLinux'+platform:'linux'",
+    },
+    {
+        "dir": "CS_RHEL7_x86_64",
+        "os_type": "linux",
+        "name": "redhat",
+        "major_version": "7",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*RHEL*'+os_version:'7'+platform:'linux'",
+    },
+    {
+        "dir": "CS_RHEL8_x86_64",
+        "os_type": "linux",
+        "name": "redhat",
+        "major_version": "8",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*RHEL*'+os_version:'8'+platform:'linux'",
+    },
+    {
+        "dir": "CS_RHEL8_ARM64",
+        "os_type": "linux",
+        "name": "redhat",
+        "major_version": "8",
+        "minor_version": "",
+        "arch_type": "arm64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*RHEL*'+os_version:'8 - arm64'+platform:'linux'",
+    },
+    {
+        "dir": "CS_RHEL9_x86_64",
+        "os_type": "linux",
+        "name": "redhat",
+        "major_version": "9",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*RHEL*'+os_version:'9'+platform:'linux'",
+    },
+    {
+        "dir": "CS_RHEL9_ARM64",
+        "os_type": "linux",
+        "name": "redhat",
+        "major_version": "9",
+        "minor_version": "",
+        "arch_type": "arm64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*RHEL*'+os_version:'9 - arm64'+platform:'linux'",
+    },
+    {
+        "dir": "CS_CENTOS7_x86_64",
+        "os_type": "linux",
+        "name": "centos",
+        "major_version": "7",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*CentOS*'+os_version:'7'+platform:'linux'",
+    },
+    {
+        "dir": "CS_CENTOS8_x86_64",
+        "os_type": "linux",
+        "name": "centos",
+        "major_version": "8",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*CentOS*'+os_version:'8'+platform:'linux'",
+    },
+    {
+        "dir": "CS_CENTOS8_ARM64",
+        "os_type": "linux",
+        "name": "centos",
+        "major_version": "8",
+        "minor_version": "",
+        "arch_type": "arm64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*CentOS*'+os_version:'8 - arm64'+platform:'linux'",
+    },
+    {
+        "dir": "CS_ORACLE6_x86_64",
+        "os_type": "linux",
+        "name": "oracle",
+        "major_version": "6",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*Oracle*'+os_version:'6'+platform:'linux'",
+    },
+    {
+        "dir": "CS_ORACLE7_x86_64",
+        "os_type": "linux",
+        "name": "oracle",
+        "major_version": "7",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*Oracle*'+os_version:'7'+platform:'linux'",
+    },
+    {
+        "dir": "CS_ORACLE8_x86_64",
+        "os_type": "linux",
+        "name": "oracle",
+        "major_version": "8",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*Oracle*'+os_version:'8'+platform:'linux'",
+    },
+    {
+        "dir": "CS_ORACLE9_x86_64",
+        "os_type": "linux",
+        "name": "oracle",
+        "major_version": "9",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "yum",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*Oracle*'+os_version:'9'+platform:'linux'",
+    },
+    {
+        "dir": "CS_SLES12_x86_64",
+        "os_type": "linux",
+        "name": "suse",
+        "major_version": "12",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "zypper",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*SLES*'+os_version:'12'+platform:'linux'",
+    },
+    {
+        "dir": "CS_SLES15_x86_64",
+        "os_type": "linux",
+        "name": "suse",
+        "major_version": "15",
+        "minor_version": "",
+        "arch_type": "x86_64",
+        "installer": "zypper",
+        "sensor_file": "falcon-sensor.rpm",
+        "filter": "os:'*SLES*'+os_version:'15'+platform:'linux'",
+    },
+    {
+        "dir": "CS_WINDOWS",
+        "id": "windows",
+        "os_type": "windows",
+        "name": "windows",
+        "major_version": "_any",
+        "minor_version": "",
+        "arch_type": "_any",
+        "installer": "windows",
+        "sensor_file": "WindowsSensor.exe",
+        "filter": "os:'Windows'+platform:'windows'",
+    },
+]
+
+
+def select_platforms(patterns=None, matrix=None):
+    """Return the platforms whose directory matches any of the patterns.
+
+    :param patterns: Comma separated, case insensitive glob patterns matched
+        against the package directory, e.g. "*ARM64" or "CS_RHEL*,CS_CENTOS*".
+        All platforms are returned when no patterns are given.
+    :param matrix: The platform matrix to select from
+    :return: List of platform entries
+    """
+    matrix = PLATFORM_MATRIX if matrix is None else matrix
+    if not patterns:
+        return list(matrix)
+    pattern_list = [pattern.strip().upper() for pattern in patterns.split(",")]
+    selected = [
+        platform
+        for platform in matrix
+        if any(fnmatch(platform["dir"].upper(), pattern) for pattern in pattern_list)
+    ]
+    if not selected:
+        raise ValueError(f"No platforms match {patterns}")
+    return selected
+
+
+def download_plan(platforms):
+    """Return the sensor download plan for the platforms.
+
+    :param platforms: List of platform entries
+    :return: List of {"filter", "path", "installer"} items
+    """
+    return [
+        {
+            "filter": platform["filter"],
+            "path": f"{platform['dir']}/{platform['sensor_file']}",
+            "installer": platform["installer"],
+        }
+        for platform in platforms
+    ]
+
+
+def mapping_index(platforms):
+    """Return the MappingIndex describing the platforms."""
+    return MappingIndex(
+        PackageMapping(
+            platform["os_type"],
+            platform["dir"],
+            platform["dir"] + ".zip",
+            platform["name"],
+            platform["major_version"],
+            platform["arch_type"],
+            minor_version=platform["minor_version"],
+            id=platform.get("id"),
+        )
+        for platform in platforms
+    )
+
+
+def agent_list(platforms):
+    """Return the agent_list.json content for the platforms."""
+    mappings = {os_type: [] for os_type in reversed(OS_LIST)}
+    for mapping in mapping_index(platforms):
+        entry = {"id": mapping.id} if mapping.id else {}
+        entry.update(
+            {
+                "dir": mapping.dir,
+                "file": mapping.file,
+                "name": mapping.name,
+                "major_version": mapping.major_version,
+                "minor_version": mapping.minor_version,
+                "arch_type": mapping.arch_type,
+            }
+        )
+        mappings[mapping.os_type].append(entry)
+    return mappings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate agent_list.json from the platform matrix"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with an error if agent_list.json is out of date instead of writing it.",
+    )
+    args = parser.parse_args()
+
+    content = json.dumps(agent_list(PLATFORM_MATRIX), indent=2) + "\n"
+    if args.check:
+        with open(AGENT_LIST_FILE, "r", encoding="utf-8") as file_handle:
+            if file_handle.read() != content:
+                sys.exit(f"{AGENT_LIST_FILE} is out of date, run platforms.py")
+        print(f"{AGENT_LIST_FILE} is up to date")
+    else:
+        with open(AGENT_LIST_FILE, "w", encoding="utf-8") as file_handle:
+            file_handle.write(content)
+        print(f"Wrote {AGENT_LIST_FILE}")
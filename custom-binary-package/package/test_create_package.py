@@ -0,0 +1,79 @@
+"""End to end tests of create-package.py against the local backend.
+
+    python3 -m pytest test_create_package.py
+"""
+import pytest
+
+ClientError = pytest.importorskip("botocore.exceptions").ClientError
+
+from distributor import backends  # pylint: disable=C0413
+
+CREATE_PACKAGE = "create-package.py"
+
+
+def test_unchanged_zips_are_not_uploaded_again(run_script, uploads, published):
+    run_script(CREATE_PACKAGE, "-n", "0")
+    first_uploads = list(uploads)
+    versions, _ = published()
+    assert any(key.endswith(".zip") for key in first_uploads)
+    assert len(versions) == 1
+
+    uploads.clear()
+    run_script(CREATE_PACKAGE, "-n", "0")
+    assert not [key for key in uploads if key.endswith(".zip")]
+    # The same build maps back to the version already published
+    assert len(published()[0]) == 1
+
+
+def test_rebuilding_a_published_version_promotes_it(run_script, published):
+    run_script(CREATE_PACKAGE, "-n", "1,0")
+    versions, canary_default = published()
+    assert len(versions) == 2
+    canary = next(version for version in versions if not version["IsDefaultVersion"])
+
+    run_script(CREATE_PACKAGE, "-n", "0")
+    versions, default = published()
+    assert len(versions) == 2
+    assert next(version for version in versions if version["IsDefaultVersion"]) == dict(
+        canary, IsDefaultVersion=True
+    )
+    assert default["version"] != canary_default["version"]
+
+
+def test_resume_after_throttling(run_script, uploads, published, monkeypatch):
+    admit = backends.LocalSSMStore.admit
+
+    def throttled(self, operation):
+        if operation in ("CreateDocument", "UpdateDocument"):
+            raise ClientError(
+                {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+                operation,
+            )
+        return admit(self, operation)
+
+    monkeypatch.setattr(backends.LocalSSMStore, "admit", throttled)
+    with pytest.raises(ClientError):
+        run_script(CREATE_PACKAGE, "-n", "1,0")
+    assert uploads
+
+    monkeypatch.setattr(backends.LocalSSMStore, "admit", admit)
+    downloads = []
+    command = backends.FakeFalconAPI.command
+
+    def record(self, action, **params):
+        if action == "DownloadSensorInstallerById":
+            downloads.append(params["id"])
+        return command(self, action, **params)
+
+    monkeypatch.setattr(backends.FakeFalconAPI, "command", record)
+    uploads.clear()
+    run_script(CREATE_PACKAGE, "-n", "1,0", "--resume")
+    # Downloads and uploads were checkpointed, only the publish is repeated
+    assert not downloads
+    assert not uploads
+    assert len(published()[0]) == 2
+
+
+def test_platforms_needs_a_single_sensor_version(run_script):
+    with pytest.raises(SystemExit, match="--platforms"):
+        run_script(CREATE_PACKAGE, "-n", "1,0", "--platforms", "*ARM64")
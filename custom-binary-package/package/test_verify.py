@@ -0,0 +1,67 @@
+"""Tests of verify.py against a package published to the local backend.
+
+    python3 -m pytest test_verify.py
+"""
+import os
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from distributor import backends  # pylint: disable=C0413
+from verify import ObjectHasher, manifest_key, verify_documents, verify_objects  # pylint: disable=C0413
+
+REGION = "us-east-1"
+BUCKET = "test-bucket"
+PACKAGE_NAME = "CrowdStrike-FalconSensor"
+
+
+def verify(local_root):
+    """Return the problems verify.py finds with the published package."""
+    backends.configure("local", str(local_root))
+    hasher = ObjectHasher(backends.client("s3", REGION), BUCKET, chunk_size=1024)
+    try:
+        problems, manifests = verify_documents(PACKAGE_NAME, [REGION], hasher)
+        problems += verify_objects(
+            [manifest for manifest in manifests.values() if manifest is not None], hasher
+        )
+    finally:
+        hasher.close()
+    return problems, manifests
+
+
+def object_path(local_root, key):
+    return os.path.join(str(local_root), "s3", BUCKET, key)
+
+
+def test_published_package_verifies(run_script, local_root):
+    run_script("create-package.py", "-n", "1,0")
+    problems, manifests = verify(local_root)
+    assert problems == []
+    assert manifests[REGION]["files"]
+
+
+def test_changed_object_is_reported(run_script, local_root):
+    run_script("create-package.py", "-n", "0")
+    _, manifests = verify(local_root)
+    file = sorted(manifests[REGION]["files"])[0]
+    with open(object_path(local_root, "falcon/" + file), "ab") as changed:
+        changed.write(b"changed")
+    problems, _ = verify(local_root)
+    assert len(problems) == 1
+    assert problems[0].startswith(f"{file}: sha256")
+
+
+def test_missing_manifest_is_reported(run_script, local_root):
+    run_script("create-package.py", "-n", "0")
+    backends.configure("local", str(local_root))
+    content = backends.client("ssm", REGION).get_document(Name=PACKAGE_NAME)["Content"]
+    os.remove(object_path(local_root, manifest_key(PACKAGE_NAME, content)))
+    problems, _ = verify(local_root)
+    assert len(problems) == 1
+    assert "unable to read" in problems[0]
+
+
+def test_missing_package_is_reported(local_root):
+    problems, _ = verify(local_root)
+    assert problems == [f"{REGION}: distributor package {PACKAGE_NAME} does not exist"]
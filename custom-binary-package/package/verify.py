@@ -0,0 +1,255 @@
+"""Verify a published distributor package.
+
+Checks that the default document version of the package is the same in
+every region, that it matches the manifest uploaded to the bucket, and
+that every file it references is in the bucket with the sha256 recorded
+in the manifest.
+
+Objects are hashed while they are downloaded with concurrent ranged GETs,
+so at most a few chunks of each object are held in memory.
+
+    python3 verify.py -r us-east-1,us-west-2 -b <S3BUCKET>
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+import _bootstrap  # pylint: disable=W0611
+from distributor import backends
+from distributor.packager import SSMPackageUpdater, manifest_file_name
+
+OBJECT_PREFIX = "falcon/"
+CHUNK_SIZE = 4 * 1024 * 1024
+# Chunks of one object requested ahead of the one being hashed
+READ_AHEAD = 4
+MAX_WORKERS = 8
+
+
+class ObjectHasher:
+    """Hash S3 objects with concurrent ranged GETs."""
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        s3_client,
+        bucket_name,
+        chunk_size=CHUNK_SIZE,
+        max_workers=MAX_WORKERS,
+        read_ahead=READ_AHEAD,
+    ):
+        """
+        :param s3_client: The S3 client
+        :param bucket_name: The bucket holding the objects
+        :param chunk_size: Bytes fetched per ranged GET
+        :param max_workers: Ranged GETs in flight at the same time, across objects
+        :param read_ahead: Chunks of one object fetched ahead of the hash
+        """
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.chunk_size = chunk_size
+        self.read_ahead = read_ahead
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def sha256(self, key):
+        """Return the sha256 hex digest of an object.
+
+        Up to read_ahead chunks are requested ahead of the one being
+        hashed, and hashed in order as they arrive.
+        """
+        size = self.s3_client.head_object(Bucket=self.bucket_name, Key=key)[
+            "ContentLength"
+        ]
+        sha256 = hashlib.sha256()
+        ranges = iter(range(0, size, self.chunk_size))
+        in_flight = deque()
+        for start in ranges:
+            in_flight.append(self._executor.submit(self._get_range, key, start, size))
+            if len(in_flight) >= self.read_ahead:
+                break
+        while in_flight:
+            sha256.update(in_flight.popleft().result())
+            start = next(ranges, None)
+            if start is not None:
+                in_flight.append(self._executor.submit(self._get_range, key, start, size))
+        return sha256.hexdigest()
+
+    def get(self, key):
+        """Return the content of a small object."""
+        return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+
+    def close(self):
+        """Stop the ranged GET workers."""
+        self._executor.shutdown()
+
+    def _get_range(self, key, start, size):
+        end = min(start + self.chunk_size, size) - 1
+        return self.s3_client.get_object(
+            Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{end}"
+        )["Body"].read()
+
+
+def manifest_key(package_name, content):
+    """Return the S3 key of the manifest file of a published document."""
+    manifest = json.loads(content)
+    return OBJECT_PREFIX + manifest_file_name(package_name, manifest["version"], content)
+
+
+def verify_documents(package_name, regions, hasher):
+    """Compare the default document of every region with the bucket.
+
+    :return: The list of problems found and the manifests by region
+    """
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        contents = dict(
+            zip(
+                regions,
+                executor.map(
+                    lambda region: SSMPackageUpdater(region).get_manifest_content(
+                        package_name
+                    ),
+                    regions,
+                ),
+            )
+        )
+    manifests = {
+        region: None if content is None else json.loads(content)
+        for region, content in contents.items()
+    }
+    problems = []
+    for region, manifest in manifests.items():
+        if manifest is None:
+            problems.append(f"{region}: distributor package {package_name} does not exist")
+            continue
+        key = manifest_key(package_name, contents[region])
+        try:
+            uploaded = json.loads(hasher.get(key))
+        except (BotoCoreError, ClientError) as err:
+            problems.append(f"{region}: unable to read {key}: {err}")
+            continue
+        if uploaded != manifest:
+            problems.append(
+                f"{region}: default version {manifest['version']} does not match {key}"
+            )
+    versions = {
+        json.dumps(manifest, sort_keys=True)
+        for manifest in manifests.values()
+        if manifest is not None
+    }
+    if len(versions) > 1:
+        problems.append(
+            "Default document versions differ between regions: "
+            + ", ".join(
+                f"{region}={manifest['version']}"
+                for region, manifest in manifests.items()
+                if manifest is not None
+            )
+        )
+    return problems, manifests
+
+
+def verify_objects(manifests, hasher, max_workers=MAX_WORKERS):
+    """Hash every file the manifests reference and compare the checksums.
+
+    :return: The list of problems found
+    """
+    expected = {}
+    for manifest in manifests:
+        for file, meta in manifest["files"].items():
+            expected[file] = meta["checksums"]["sha256"]
+
+    def check(item):
+        file, sha = item
+        try:
+            actual = hasher.sha256(OBJECT_PREFIX + file)
+        except (BotoCoreError, ClientError) as err:
+            return f"{file}: unable to read object: {err}"
+        if actual != sha:
+            return f"{file}: sha256 {actual} does not match the manifest {sha}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(check, sorted(expected.items())))
+    print(f"Verified {len(expected)} objects")
+    return [problem for problem in results if problem]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Verify a published distributor package against its S3 bucket"
+    )
+    parser.add_argument(
+        "-r",
+        "--aws_regions",
+        required=True,
+        help="A comma seperate list of aws regions the distributor package is published in. "
+        "The bucket is read through the first region.",
+    )
+    parser.add_argument(
+        "-b",
+        "--s3bucket",
+        required=True,
+        help="The name of the s3 bucket holding the package files.",
+    )
+    parser.add_argument(
+        "-p",
+        "--package_name",
+        help="The name of the distributor package to verify.",
+        default="CrowdStrike-FalconSensor",
+    )
+    parser.add_argument(
+        "-w",
+        "--max_workers",
+        type=int,
+        default=MAX_WORKERS,
+        help="Objects hashed, and ranged GETs in flight, at the same time.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Bytes fetched per ranged GET.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=backends.BACKENDS,
+        default="aws",
+        help="Verify against AWS, or against the local S3 and SSM fakes.",
+    )
+    parser.add_argument(
+        "--local_root",
+        default=backends.LOCAL_ROOT,
+        help="Directory holding the state of the local backend.",
+    )
+    args = parser.parse_args()
+    backends.configure(args.backend, args.local_root)
+
+    regions = [region.strip() for region in args.aws_regions.split(",")]
+    object_hasher = ObjectHasher(
+        backends.client("s3", regions[0]),
+        args.s3bucket,
+        chunk_size=args.chunk_size,
+        max_workers=args.max_workers,
+    )
+    try:
+        errors, region_manifests = verify_documents(
+            args.package_name, regions, object_hasher
+        )
+        errors += verify_objects(
+            [manifest for manifest in region_manifests.values() if manifest is not None],
+            object_hasher,
+            max_workers=args.max_workers,
+        )
+    finally:
+        object_hasher.close()
+
+    if errors:
+        print("Verification failed:")
+        for error in errors:
+            print(f"  {error}")
+        sys.exit(1)
+    print(f"Distributor package {args.package_name} verified in {', '.join(regions)}")
@@ -0,0 +1,15 @@
+"""Distributor packaging engine shared by the custom package layouts.
+
+The scripts of the custom-api and custom-binary layouts import their
+_bootstrap module, which adds the repository root to sys.path, then import
+the engine from here:
+
+- packager: build, upload and publish Distributor packages
+- mappings: the validated agent_list.json model
+- manifest: manifest generation and the SSM document size limit
+- checkpoint: the journal behind --resume
+- backends: AWS and Falcon clients, or local fakes for offline runs
+- falcon_session: thread safe Falcon API access
+- watch: the --watch edit and republish loop
+- profiling: per stage profiles behind --profile
+"""
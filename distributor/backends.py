@@ -0,0 +1,483 @@
+"""Pluggable AWS and Falcon backends.
+
+The packaging scripts create their S3, SSM and Falcon API clients through
+this module. By default these are boto3 clients and a FalconSession. After
+configure("local", root), the clients are local fakes instead:
+
+- LocalS3Client stores buckets and objects as directories and files
+  under <root>/s3.
+- LocalSSMClient keeps Package documents with their versions, default
+  version, version limit and size limit in a store shared by every client
+  of a region, saved to <root>/ssm-<region>.json so later runs see what
+  earlier runs published. Calls above a per region rate raise
+  ThrottlingException.
+- FakeFalconAPI serves synthetic sensor installers for any installer
+  filter.
+
+This lets the whole pipeline run on one machine without AWS or Falcon
+credentials. The behaviour of the fakes is tuned with environment variables:
+
+    LOCAL_S3_LATENCY            seconds added to every S3 call (0)
+    LOCAL_SSM_MAX_TPS           SSM calls per second per region before
+                                throttling, 0 for no limit (0)
+    LOCAL_SSM_MAX_VERSIONS      document versions kept per document (1000)
+    LOCAL_FALCON_INSTALLER_SIZE size of the synthetic installers in bytes (1 MiB)
+    LOCAL_FALCON_VERSIONS       sensor versions served per filter (3)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import boto3
+from botocore.exceptions import ClientError
+from .manifest import SSM_DOCUMENT_MAX_BYTES
+
+BACKENDS = ("aws", "local")
+LOCAL_ROOT = "./local-backend"
+
+_BACKEND = {"name": "aws", "local": None}
+# boto3 creates clients from a default session that is not thread safe
+_CLIENT_LOCK = threading.Lock()
+
+
+class FalconAPIError(Exception):
+    """Raised when the Falcon API cannot be authenticated against or reached."""
+
+
+def configure(name="aws", root=LOCAL_ROOT):
+    """Select the backend used by client() and falcon_client().
+
+    :param name: "aws" for the real services, "local" for the fakes
+    :param root: Directory holding the state of the local backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, expected one of {BACKENDS}")
+    _BACKEND["name"] = name
+    _BACKEND["local"] = LocalBackend(root) if name == "local" else None
+
+
+def is_local():
+    """Return True if the local backend is configured."""
+    return _BACKEND["name"] == "local"
+
+
+def client(service, region_name):
+    """Return an S3 or SSM client for the configured backend."""
+    if not is_local():
+        with _CLIENT_LOCK:
+            return boto3.client(service, region_name=region_name)
+    return _BACKEND["local"].client(service, region_name)
+
+
+def falcon_client(client_id, client_secret):
+    """Return a Falcon API client for the configured backend."""
+    if not is_local():
+        # Imported here so the local backend does not need requests
+        from .falcon_session import FalconSession  # pylint: disable=C0415
+
+        return FalconSession(client_id=client_id, client_secret=client_secret)
+    return _BACKEND["local"].falcon
+
+
+def _client_error(code, message, operation):
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def _error_class(code):
+    """Create a modeled exception class, as boto3 clients expose them."""
+    return type(code, (ClientError,), {})
+
+
+class LocalBackend:
+    """State shared by the local fakes of one run."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._ssm_stores = {}
+        self.s3 = LocalS3Client(
+            os.path.join(root, "s3"),
+            latency=float(os.environ.get("LOCAL_S3_LATENCY", "0")),
+        )
+        self.falcon = FakeFalconAPI(
+            installer_size=int(os.environ.get("LOCAL_FALCON_INSTALLER_SIZE", 1024 * 1024)),
+            versions=int(os.environ.get("LOCAL_FALCON_VERSIONS", "3")),
+        )
+
+    def client(self, service, region_name):
+        """Return the fake client of an AWS service."""
+        if service == "s3":
+            return self.s3
+        if service == "ssm":
+            with self._lock:
+                if region_name not in self._ssm_stores:
+                    self._ssm_stores[region_name] = LocalSSMStore(
+                        os.path.join(self.root, f"ssm-{region_name}.json"),
+                        max_tps=float(os.environ.get("LOCAL_SSM_MAX_TPS", "0")),
+                        max_versions=int(os.environ.get("LOCAL_SSM_MAX_VERSIONS", "1000")),
+                    )
+            return LocalSSMClient(self._ssm_stores[region_name])
+        raise ValueError(f"The local backend does not provide {service}")
+
+
+class LocalS3Client:
+    """S3 client storing buckets as directories."""
+
+    def __init__(self, root, latency=0.0):
+        """
+        :param root: Directory holding one directory per bucket
+        :param latency: Seconds added to every call
+        """
+        self.root = root
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def list_buckets(self):
+        self._call()
+        return {"Buckets": [{"Name": name} for name in sorted(os.listdir(self.root))]}
+
+    def head_bucket(self, Bucket):  # pylint: disable=C0103
+        self._call()
+        if not os.path.isdir(os.path.join(self.root, Bucket)):
+            raise _client_error("404", "Not Found", "HeadBucket")
+        return {}
+
+    def create_bucket(self, Bucket, **_kwargs):  # pylint: disable=C0103
+        self._call()
+        os.makedirs(os.path.join(self.root, Bucket), exist_ok=True)
+        return {"Location": f"/{Bucket}"}
+
+    def put_object(self, Bucket, Key, Body):  # pylint: disable=C0103
+        self._call()
+        path = self._object_path(Bucket, Key, "PutObject")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = Body if isinstance(Body, bytes) else Body.read()
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as object_file:
+            object_file.write(data)
+        os.replace(tmp_path, path)
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"'}  # nosec
+
+    def head_object(self, Bucket, Key):  # pylint: disable=C0103
+        self._call()
+        path = self._object_path(Bucket, Key, "HeadObject")
+        if not os.path.isfile(path):
+            raise _client_error("404", "Not Found", "HeadObject")
+        return {"ContentLength": os.path.getsize(path)}
+
+    def get_object(self, Bucket, Key, Range=None):  # pylint: disable=C0103
+        self._call()
+        path = self._object_path(Bucket, Key, "GetObject")
+        if not os.path.isfile(path):
+            raise _client_error("NoSuchKey", f"{Key} does not exist", "GetObject")
+        with open(path, "rb") as object_file:
+            if Range is None:
+                data = object_file.read()
+            else:
+                start, end = (int(part) for part in Range.split("=")[1].split("-"))
+                object_file.seek(start)
+                data = object_file.read(end - start + 1)
+        return {"Body": SimpleNamespace(read=lambda: data), "ContentLength": len(data)}
+
+    def _object_path(self, bucket, key, operation):
+        if not os.path.isdir(os.path.join(self.root, bucket)):
+            raise _client_error("NoSuchBucket", f"{bucket} does not exist", operation)
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class LocalSSMStore:
+    """Package documents of one region, with versions and limits."""
+
+    def __init__(self, path, max_tps=0.0, max_versions=1000):
+        """
+        :param path: JSON file the documents are saved to
+        :param max_tps: Calls per second before throttling, 0 for no limit
+        :param max_versions: Versions kept per document
+        """
+        self.path = path
+        self.max_tps = max_tps
+        self.max_versions = max_versions
+        self.lock = threading.Lock()
+        self.documents = {}
+        self.calls = 0
+        self.throttled = 0
+        self._window = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as store:
+                self.documents = json.load(store)
+
+    def admit(self, operation):
+        """Count a call, raising ThrottlingException above max_tps."""
+        with self.lock:
+            self.calls += 1
+            if not self.max_tps:
+                return
+            now = time.monotonic()
+            self._window = [started for started in self._window if now - started < 1]
+            if len(self._window) >= self.max_tps:
+                self.throttled += 1
+                raise _client_error("ThrottlingException", "Rate exceeded", operation)
+            self._window.append(now)
+
+    def save(self):
+        """Write the documents, called with the lock held."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as store:
+            json.dump(self.documents, store)
+        os.replace(tmp_path, self.path)
+
+
+class LocalSSMClient:
+    """SSM client for Package documents backed by a LocalSSMStore."""
+
+    exceptions = SimpleNamespace(
+        **{
+            code: _error_class(code)
+            for code in (
+                "InvalidDocument",
+                "InvalidDocumentVersion",
+                "DuplicateDocumentContent",
+                "DuplicateDocumentVersionName",
+                "DocumentVersionLimitExceeded",
+                "DocumentAlreadyExists",
+                "MaxDocumentSizeExceeded",
+            )
+        }
+    )
+
+    def __init__(self, store):
+        self.store = store
+
+    def get_document(self, Name, DocumentVersion=None):  # pylint: disable=C0103
+        self.store.admit("GetDocument")
+        with self.store.lock:
+            document = self._document(Name, "GetDocument")
+            version = self._version(document, DocumentVersion or document["default"])
+            return {
+                "Name": Name,
+                "DocumentVersion": version["version"],
+                "VersionName": version.get("name"),
+                "Content": version["content"],
+                "DocumentType": "Package",
+                "DocumentFormat": "JSON",
+            }
+
+    def create_document(self, Name, Content, **kwargs):  # pylint: disable=C0103
+        self.store.admit("CreateDocument")
+        self._check_size(Content, "CreateDocument")
+        with self.store.lock:
+            if Name in self.store.documents:
+                raise self._error("DocumentAlreadyExists", Name, "CreateDocument")
+            version = self._new_version("1", Content, kwargs)
+            self.store.documents[Name] = {
+                "default": "1",
+                "latest": "1",
+                "next": 2,
+                "versions": {"1": version},
+            }
+            self.store.save()
+            return {"DocumentDescription": self._describe(Name, version)}
+
+    def update_document(  # pylint: disable=C0103
+        self, Name, Content, DocumentVersion="$LATEST", **kwargs
+    ):
+        self.store.admit("UpdateDocument")
+        self._check_size(Content, "UpdateDocument")
+        with self.store.lock:
+            document = self._document(Name, "UpdateDocument")
+            self._version(document, DocumentVersion)
+            if document["versions"][document["latest"]]["content"] == Content:
+                raise self._error("DuplicateDocumentContent", Name, "UpdateDocument")
+            version_name = kwargs.get("VersionName")
+            if version_name and any(
+                version.get("name") == version_name
+                for version in document["versions"].values()
+            ):
+                raise self._error(
+                    "DuplicateDocumentVersionName", version_name, "UpdateDocument"
+                )
+            if len(document["versions"]) >= self.store.max_versions:
+                raise self._error(
+                    "DocumentVersionLimitExceeded", Name, "UpdateDocument"
+                )
+            number = str(document["next"])
+            document["next"] += 1
+            document["latest"] = number
+            version = self._new_version(number, Content, kwargs)
+            document["versions"][number] = version
+            self.store.save()
+            return {"DocumentDescription": self._describe(Name, version)}
+
+    def update_document_default_version(  # pylint: disable=C0103
+        self, Name, DocumentVersion
+    ):
+        self.store.admit("UpdateDocumentDefaultVersion")
+        with self.store.lock:
+            document = self._document(Name, "UpdateDocumentDefaultVersion")
+            document["default"] = self._version(document, DocumentVersion)["version"]
+            self.store.save()
+            return {"Description": {"Name": Name, "DefaultVersion": document["default"]}}
+
+    def list_document_versions(self, Name, **_kwargs):  # pylint: disable=C0103
+        self.store.admit("ListDocumentVersions")
+        with self.store.lock:
+            document = self._document(Name, "ListDocumentVersions")
+            return {
+                "DocumentVersions": [
+                    {
+                        "Name": Name,
+                        "DocumentVersion": number,
+                        "VersionName": version.get("name"),
+                        "IsDefaultVersion": number == document["default"],
+                    }
+                    for number, version in sorted(
+                        document["versions"].items(), key=lambda item: int(item[0])
+                    )
+                ]
+            }
+
+    def delete_document(self, Name, DocumentVersion=None, **_kwargs):  # pylint: disable=C0103
+        self.store.admit("DeleteDocument")
+        with self.store.lock:
+            document = self._document(Name, "DeleteDocument")
+            if DocumentVersion is None:
+                del self.store.documents[Name]
+            else:
+                number = self._version(document, DocumentVersion)["version"]
+                if number == document["default"]:
+                    raise self._error("InvalidDocumentVersion", number, "DeleteDocument")
+                del document["versions"][number]
+            self.store.save()
+            return {}
+
+    def _document(self, name, operation):
+        if name not in self.store.documents:
+            raise self._error("InvalidDocument", name, operation)
+        return self.store.documents[name]
+
+    def _version(self, document, number):
+        if number == "$LATEST":
+            number = document["latest"]
+        elif number == "$DEFAULT":
+            number = document["default"]
+        if number not in document["versions"]:
+            raise self._error("InvalidDocumentVersion", number, "GetDocument")
+        return document["versions"][number]
+
+    def _check_size(self, content, operation):
+        if len(content.encode("utf-8")) > SSM_DOCUMENT_MAX_BYTES:
+            raise self._error("MaxDocumentSizeExceeded", "Content", operation)
+
+    def _error(self, code, subject, operation):
+        return getattr(self.exceptions, code)(
+            {"Error": {"Code": code, "Message": f"{code}: {subject}"}}, operation
+        )
+
+    @staticmethod
+    def _new_version(number, content, kwargs):
+        return {
+            "version": number,
+            "name": kwargs.get("VersionName"),
+            "content": content,
+            "attachments": kwargs.get("Attachments", []),
+            "created": datetime.now(timezone.utc).isoformat(),
+        }
+
+    @staticmethod
+    def _describe(name, version):
+        return {
+            "Name": name,
+            "DocumentVersion": version["version"],
+            "VersionName": version["name"],
+        }
+
+
+class FakeFalconAPI:
+    """Falcon API serving synthetic sensor installers.
+
+    Every installer filter gets the same sensor versions, newest first, and
+    each installer is generated from its filter and version so repeated
+    runs download identical bytes.
+    """
+
+    def __init__(self, installer_size=1024 * 1024, versions=3):
+        """
+        :param installer_size: Size of the synthetic installers in bytes
+        :param versions: Sensor versions served per filter
+        """
+        self.installer_size = installer_size
+        self.versions = versions
+        self.requests = 0
+        self._installers = {}
+        self._lock = threading.Lock()
+
+    def command(self, action, **params):
+        """Answer the installer query and download operations."""
+        with self._lock:
+            self.requests += 1
+        if action == "GetCombinedSensorInstallersByQuery":
+            return {
+                "status_code": 200,
+                "headers": {},
+                "body": {"resources": self._query(params["filter"])},
+            }
+        if action == "DownloadSensorInstallerById":
+            with self._lock:
+                content = self._installers.get(params["id"])
+            if content is None:
+                return {"status_code": 404, "headers": {}, "body": {"errors": []}}
+            return content
+        raise ValueError(f"Unsupported Falcon API operation: {action}")
+
+    def stats(self):
+        """Return request statistics in the shape of FalconSession.stats()."""
+        return {
+            "workers": 0,
+            "requests": self.requests,
+            "connections": 0,
+            "reused": 0,
+            "token_requests": 0,
+        }
+
+    def close(self):
+        """Nothing to close, present for FalconSession compatibility."""
+
+    def _query(self, installer_filter):
+        os_name = re.search(r"\bos:'([^']*)'", installer_filter)
+        os_version = re.search(r"\bos_version:'([^']*)'", installer_filter)
+        resources = []
+        for index in range(self.versions):
+            version = f"7.{20 - index}.{18000 - index * 100}"
+            content = self._installer(installer_filter, version)
+            sha = hashlib.sha256(content).hexdigest()
+            with self._lock:
+                self._installers[sha] = content
+            resources.append(
+                {
+                    "sha256": sha,
+                    "name": f"falcon-sensor-{version}",
+                    "os": os_name.group(1) if os_name else "",
+                    "os_version": os_version.group(1) if os_version else "",
+                    "version": version,
+                }
+            )
+        return resources
+
+    def _installer(self, installer_filter, version):
+        seed = hashlib.sha256(f"{installer_filter}|{version}".encode()).digest()
+        return (seed * (self.installer_size // len(seed) + 1))[: self.installer_size]
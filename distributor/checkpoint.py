@@ -0,0 +1,96 @@
+"""Checkpoint journal for resumable packaging runs.
+
+Every completed unit of work (a downloaded sensor, a built package
+version, an uploaded object, a published region) is appended to a JSON
+lines journal as soon as it finishes. A run started with --resume loads
+the journal and skips the units it records, after checking their files
+still match the recorded sha256.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+
+class CheckpointJournal:
+    """Append only journal of completed pipeline units."""
+
+    def __init__(self, path, resume=False, run_args=None):
+        """
+        :param path: Path of the journal file
+        :param resume: Load the existing journal instead of starting over
+        :param run_args: Arguments identifying the run, a journal written for
+            other arguments is not resumed
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if resume and os.path.exists(path):
+            self._load()
+            recorded_args = self.get("run", "args")
+            if recorded_args is not None and recorded_args.get("value") != run_args:
+                raise SystemExit(
+                    f"Checkpoint {path} was written for different arguments: "
+                    f"{recorded_args.get('value')}"
+                )
+            print(f"Resuming from checkpoint {path}")
+        else:
+            with open(path, "w", encoding="utf-8"):
+                pass
+            self.record("run", "args", value=run_args)
+
+    def _load(self):
+        """Read the journal, ignoring a partially written last line."""
+        with open(self.path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._entries[(entry["stage"], entry["key"])] = entry
+
+    def record(self, stage, key, **data):
+        """Record a completed unit of work."""
+        entry = dict(data, stage=stage, key=key)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as journal:
+                journal.write(json.dumps(entry) + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._entries[(stage, key)] = entry
+
+    def get(self, stage, key):
+        """Return the recorded entry for a unit of work, or None."""
+        return self._entries.get((stage, key))
+
+    def done(self, stage, key):
+        """Return True if the unit of work has been recorded."""
+        return (stage, key) in self._entries
+
+    def verified(self, stage, key, file_path, sha256=None):
+        """Return True if the unit is recorded and its file is intact.
+
+        :param stage: The pipeline stage
+        :param key: The unit of work
+        :param file_path: The file the unit produced
+        :param sha256: Expected sha256, defaults to the recorded one
+        """
+        entry = self.get(stage, key)
+        if entry is None or not os.path.isfile(file_path):
+            return False
+        return file_sha256(file_path) == (sha256 or entry.get("sha256"))
+
+    def remove(self):
+        """Delete the journal once the run has completed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def file_sha256(file_path):
+    """Return the sha256 hex digest of a file."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file_handle:
+        for chunk in iter(lambda: file_handle.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
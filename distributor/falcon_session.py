@@ -0,0 +1,204 @@
+"""Thread safe access to the CrowdStrike Falcon API.
+
+FalconSession shares one OAuth2 token between every worker thread. The
+token is refreshed shortly before it expires, by a single thread while
+the others wait for it. Each worker thread keeps its own pooled
+keep-alive HTTP session, so installers fetched by the same worker reuse
+one TLS connection.
+
+Only the sensor download API calls used by create-package.py are
+supported, through the same command() interface as falconpy's
+APIHarness. falconpy clients can be handed a token, but not refresh one
+on behalf of other clients, and they do not expose their connection pools,
+so these two calls are made with requests directly.
+"""
+
+import threading
+import time
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError as no_requests:
+    raise SystemExit(
+        "The requests library must be installed in order to use this utility.\n"
+        "Install this application with the command `python3 -m pip install requests`."
+    ) from no_requests
+
+from .backends import FalconAPIError
+
+BASE_URL = "https://api.crowdstrike.com"
+# The token endpoint reports the cloud of the API client in the X-Cs-Region header
+CLOUD_BASE_URLS = {
+    "us-1": "https://api.crowdstrike.com",
+    "us-2": "https://api.us-2.crowdstrike.com",
+    "eu-1": "https://api.eu-1.crowdstrike.com",
+    "us-gov-1": "https://api.laggar.gcw.crowdstrike.com",
+}
+# Refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+# (connect, read) timeouts in seconds, the read timeout applies between received bytes
+REQUEST_TIMEOUT = (10, 60)
+# (path, binary response) of the supported API operations
+ACTIONS = {
+    "GetCombinedSensorInstallersByQuery": ("/sensors/combined/installers/v1", False),
+    "DownloadSensorInstallerById": ("/sensors/entities/download-installer/v1", True),
+}
+
+
+class FalconSession:  # pylint: disable=R0902
+    """Falcon API client that can be shared between threads."""
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        client_id,
+        client_secret,
+        base_url=BASE_URL,
+        pool_size=1,
+        clock=time.time,
+        timeout=REQUEST_TIMEOUT,
+    ):
+        """
+        :param client_id: The Falcon API client ID
+        :param client_secret: The Falcon API client secret
+        :param base_url: The Falcon API base URL, followed to the cloud of
+            the API client when the token endpoint reports another one
+        :param pool_size: Connections kept alive per worker thread
+        :param clock: Function returning the current time in seconds
+        :param timeout: (connect, read) timeouts of each request in seconds
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.clock = clock
+        self.timeout = timeout
+        self.token_requests = 0
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+    def command(self, action, **params):
+        """Call a Falcon API operation.
+
+        :param action: The operation ID, e.g. DownloadSensorInstallerById
+        :param params: The query parameters of the operation
+        :return: The response bytes of a successful download, otherwise a
+            dictionary with the status_code, headers and body of the response
+        :raises FalconAPIError: If authentication fails or the API cannot be
+            reached in time
+        """
+        try:
+            path, binary = ACTIONS[action]
+        except KeyError as unknown:
+            raise ValueError(f"Unsupported Falcon API operation: {action}") from unknown
+        token = self.token()
+        response = self._get(path, params, token)
+        if response.status_code == 401:
+            # Revoked or expired early, refresh once and retry
+            self._invalidate(token)
+            response = self._get(path, params, self.token())
+        if binary and response.status_code == 200:
+            return response.content
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        return {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "body": body,
+        }
+
+    def token(self):
+        """Return a valid access token, requesting a new one if needed."""
+        token = self._token
+        if token is not None and self.clock() < self._token_expires:
+            return token
+        with self._token_lock:
+            # Another thread may have refreshed the token while we waited
+            if self._token is not None and self.clock() < self._token_expires:
+                return self._token
+            try:
+                response = self._session.post(
+                    f"{self.base_url}/oauth2/token",
+                    data={"client_id": self.client_id, "client_secret": self.client_secret},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as err:
+                raise FalconAPIError(f"Unable to reach the Falcon API: {err}") from err
+            self.token_requests += 1
+            if response.status_code != 201:
+                raise FalconAPIError(
+                    f"Unable to authenticate with the Falcon API: {response.status_code}"
+                )
+            body = response.json()
+            self.base_url = CLOUD_BASE_URLS.get(
+                response.headers.get("X-Cs-Region"), self.base_url
+            )
+            self._token_expires = (
+                self.clock() + body["expires_in"] - TOKEN_REFRESH_MARGIN
+            )
+            self._token = body["access_token"]
+            return self._token
+
+    def stats(self):
+        """Return connection reuse statistics for every worker session."""
+        requests_sent = 0
+        connections = 0
+        with self._sessions_lock:
+            for session in self._sessions:
+                for adapter in set(session.adapters.values()):
+                    pools = adapter.poolmanager.pools
+                    for key in pools.keys():
+                        pool = pools[key]
+                        requests_sent += pool.num_requests
+                        connections += pool.num_connections
+        return {
+            "workers": len(self._sessions),
+            "requests": requests_sent,
+            "connections": connections,
+            "reused": requests_sent - connections,
+            "token_requests": self.token_requests,
+        }
+
+    def close(self):
+        """Close the connections of every worker session."""
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+    def _get(self, path, params, token):
+        try:
+            return self._session.get(
+                f"{self.base_url}{path}",
+                params=params,
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as err:
+            raise FalconAPIError(f"Unable to reach the Falcon API: {err}") from err
+
+    def _invalidate(self, token):
+        """Drop the token, unless another thread has already replaced it."""
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+
+    @property
+    def _session(self):
+        """The keep-alive HTTP session of the calling thread."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
@@ -0,0 +1,100 @@
+"""Distributor package manifest generation.
+
+ManifestBuilder assembles the manifest in a single pass over the package
+platforms and the (file, sha256) digests of the package files. It
+serializes the manifest compactly with sorted keys, so the same package
+always produces the same document content, and checks the content
+against the SSM document size limit before anything is published.
+"""
+
+import json
+
+# SSM documents, Distributor package manifests included, are limited to 64 KB
+SSM_DOCUMENT_MAX_BYTES = 64 * 1024
+MANIFEST_SCHEMA_VERSION = "2.0"
+MANIFEST_PUBLISHER = "Crowdstrike Inc."
+
+
+class ManifestSizeError(ValueError):
+    """Raised when a manifest does not fit in an SSM document."""
+
+
+def check_document_size(content, max_bytes=SSM_DOCUMENT_MAX_BYTES):
+    """Return the size of the document content in bytes.
+
+    :param content: The serialized document content
+    :param max_bytes: The SSM document size limit
+    :raises ManifestSizeError: If the content is larger than the limit
+    """
+    size = len(content.encode("utf-8"))
+    if size > max_bytes:
+        raise ManifestSizeError(
+            f"Manifest is {size} bytes, SSM documents are limited to {max_bytes} bytes"
+        )
+    return size
+
+
+class ManifestBuilder:
+    """Build the manifest of one Distributor package version."""
+
+    def __init__(self, version, description):
+        """
+        :param version: The package version
+        :param description: The package description
+        """
+        self.version = version
+        self.description = description
+        self.packages = {}
+        self.files = {}
+
+    def add_platform(self, platform, entry):
+        """Add a platform to the packages tree.
+
+        :param platform: The (name, version, arch) of the platform
+        :param entry: The manifest entry of the platform, e.g. {"file": name}
+        """
+        name, platform_version, arch_type = platform
+        self.packages.setdefault(name, {}).setdefault(platform_version, {})[
+            arch_type
+        ] = entry
+
+    def add_digests(self, digests):
+        """Add package files from an iterable of (file, sha256) pairs."""
+        for file, sha256 in digests:
+            self.files[file] = {"checksums": {"sha256": sha256}}
+
+    def carry_over(self, live_manifest, skip_platforms):
+        """Keep the platforms of a published manifest that are not rebuilt.
+
+        :param live_manifest: The manifest of the published package
+        :param skip_platforms: Platforms of this build, not carried over
+        """
+        for name, versions in live_manifest["packages"].items():
+            for platform_version, arches in versions.items():
+                for arch_type, entry in arches.items():
+                    platform = (name, platform_version, arch_type)
+                    if platform in skip_platforms:
+                        continue
+                    self.add_platform(platform, entry)
+                    self.files[entry["file"]] = live_manifest["files"][entry["file"]]
+
+    def to_dict(self):
+        """Return the manifest as a dictionary."""
+        return {
+            "schemaVersion": MANIFEST_SCHEMA_VERSION,
+            "publisher": MANIFEST_PUBLISHER,
+            "description": self.description,
+            "version": self.version,
+            "packages": self.packages,
+            "files": self.files,
+        }
+
+    def serialize(self, max_bytes=SSM_DOCUMENT_MAX_BYTES):
+        """Return the canonical JSON content of the manifest.
+
+        :param max_bytes: The SSM document size limit
+        :raises ManifestSizeError: If the manifest is larger than the limit
+        """
+        content = json.dumps(self.to_dict(), sort_keys=True, separators=(",", ":"))
+        check_document_size(content, max_bytes)
+        return content
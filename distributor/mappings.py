@@ -0,0 +1,154 @@
+"""Indexed model of the agent_list.json package mappings.
+
+The mappings file is parsed and validated once into a MappingIndex that
+every packaging stage shares.
+"""
+
+import json
+import os
+
+OS_LIST = ["windows", "linux"]
+REQUIRED_KEYS = ("dir", "file", "name", "major_version", "arch_type")
+KNOWN_KEYS = REQUIRED_KEYS + ("minor_version", "id")
+
+
+class MappingError(ValueError):
+    """Raised when the mappings file is invalid."""
+
+
+class PackageMapping:  # pylint: disable=R0902, R0903
+    """A single agent_list.json entry."""
+
+    __slots__ = (
+        "os_type",
+        "id",
+        "dir",
+        "file",
+        "name",
+        "major_version",
+        "minor_version",
+        "arch_type",
+        "extras",
+    )
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        os_type,
+        dir,  # pylint: disable=W0622
+        file,
+        name,
+        major_version,
+        arch_type,
+        minor_version="",
+        id=None,  # pylint: disable=W0622
+        extras=None,
+    ):
+        self.os_type = os_type
+        self.id = id
+        self.dir = dir
+        self.file = file
+        self.name = name
+        self.major_version = major_version
+        self.minor_version = minor_version
+        self.arch_type = arch_type
+        # Layout specific keys, such as the custom-api "filter" and "install_tool"
+        self.extras = extras or {}
+
+    @classmethod
+    def from_dict(cls, os_type, entry):
+        """Create a mapping from a raw agent_list.json entry."""
+        missing = [key for key in REQUIRED_KEYS if not entry.get(key)]
+        if missing:
+            raise MappingError(f"{os_type} entry {entry} is missing {missing}")
+        return cls(
+            os_type,
+            entry["dir"],
+            entry["file"],
+            entry["name"],
+            entry["major_version"],
+            entry["arch_type"],
+            minor_version=entry.get("minor_version", ""),
+            id=entry.get("id"),
+            extras={key: value for key, value in entry.items() if key not in KNOWN_KEYS},
+        )
+
+    @property
+    def version(self):
+        """The platform version used in the manifest."""
+        if self.minor_version:
+            return f"{self.major_version}.{self.minor_version}"
+        return self.major_version
+
+    @property
+    def platform(self):
+        """The (name, version, arch) key of the manifest packages tree."""
+        return (self.name, self.version, self.arch_type)
+
+    def __repr__(self):
+        return f"PackageMapping({self.dir!r}, {self.platform!r})"
+
+
+class MappingIndex:
+    """Validated mappings indexed by dir, file and platform."""
+
+    def __init__(self, mappings):
+        self.mappings = tuple(mappings)
+        self.by_dir = {}
+        self.by_file = {}
+        self.by_platform = {}
+        errors = []
+        for mapping in self.mappings:
+            if mapping.platform in self.by_platform:
+                errors.append(
+                    f"Duplicate platform {mapping.platform} in {mapping.dir} "
+                    f"and {self.by_platform[mapping.platform].dir}"
+                )
+                continue
+            self.by_platform[mapping.platform] = mapping
+            self.by_dir.setdefault(mapping.dir, []).append(mapping)
+            self.by_file.setdefault(mapping.file, []).append(mapping)
+        for directory, dir_mappings in self.by_dir.items():
+            if len({mapping.file for mapping in dir_mappings}) > 1:
+                errors.append(f"Directory {directory} maps to more than one file")
+        for file, file_mappings in self.by_file.items():
+            if len({mapping.dir for mapping in file_mappings}) > 1:
+                errors.append(f"File {file} is built from more than one directory")
+        if errors:
+            raise MappingError("\n".join(errors))
+
+    @classmethod
+    def from_file(cls, filename):
+        """Parse and validate a mappings file.
+
+        :param filename: Path to agent_list.json
+        :return: A MappingIndex
+        """
+        with open(filename, "rb") as file_handle:
+            json_data = json.loads(file_handle.read())
+        unknown = set(json_data) - set(OS_LIST)
+        if unknown:
+            raise MappingError(f"Unknown os types in {filename}: {unknown}")
+        return cls(
+            PackageMapping.from_dict(os_type, entry)
+            for os_type in OS_LIST
+            for entry in json_data.get(os_type, [])
+        )
+
+    @property
+    def dirs(self):
+        """The package directories, in mappings file order."""
+        return list(self.by_dir)
+
+    def missing_dirs(self, source_dir="."):
+        """Return the package directories that do not exist in source_dir."""
+        return {
+            directory
+            for directory in self.by_dir
+            if not os.path.isdir(os.path.join(source_dir, directory))
+        }
+
+    def __len__(self):
+        return len(self.mappings)
+
+    def __iter__(self):
+        return iter(self.mappings)
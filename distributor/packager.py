@@ -0,0 +1,932 @@
+"""CrowdStrike AWS Distributor packaging engine.
+
+Builds, uploads and publishes Distributor packages for both the
+custom-api and the custom-binary package layouts. A layout runs the
+engine with a DistributorPackager, or a subclass that generates extra
+files at build time, through add_arguments() and run().
+
+Package files are stored in the bucket under names derived from their
+content, so a zip or installer that is identical across packages and
+package versions is stored and uploaded once, and referenced by every
+manifest that uses it.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from os.path import basename
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from . import backends
+from .checkpoint import CheckpointJournal, file_sha256
+from .manifest import ManifestBuilder, ManifestSizeError, check_document_size
+from .mappings import MappingError, MappingIndex
+from .profiling import StageProfiler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger()
+handler = logging.StreamHandler()
+formatter = logging.Formatter("%(levelname)-8s %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+PATH_TO_BUCKET_FOLDER = "./s3-bucket/"
+PACKAGE_DESCRIPTION = "CrowdStrike custom Install Package"
+INSTALLER_VERSION = "1.0"
+CHECKPOINT_FILE = "./.packager.checkpoint"
+MAX_UPLOAD_WORKERS = 8
+# Fixed timestamp for zip entries so identical inputs produce identical zips
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class SSMPackageUpdater:  # pylint: disable=R0903
+    """Class to represent our SSM package update."""
+
+    def __init__(self, region_name):
+        self.region = region_name
+
+    def update(
+        self, package, document_content, bucket_name, version_name=None, set_default=True
+    ):  # pylint: disable=R0913
+        """Update the SSM package.
+
+        :param package: Name of the distributor package
+        :param document_content: The manifest to publish
+        :param bucket_name: The S3 bucket holding the package files
+        :param version_name: Optional document version name
+        :param set_default: Make the published version the default version
+        :raises ManifestSizeError: If the manifest does not fit in an SSM document
+        """
+        check_document_size(document_content)
+        kwargs = {
+            "Content": document_content,
+            "Attachments": [
+                {
+                    "Key": "SourceUrl",
+                    "Values": [
+                        "https://"
+                        + bucket_name
+                        + ".s3-"
+                        + self.region
+                        + ".amazonaws.com/falcon",
+                    ],
+                },
+            ],
+            "Name": package,
+            "DocumentType": "Package",
+            "DocumentFormat": "JSON",
+        }
+        if version_name is not None:
+            kwargs["VersionName"] = version_name
+        self._doc_update_or_create(set_default, **kwargs)
+
+        print(f"Created ssm package {package}:")
+
+    def get_manifest(self, package):
+        """Return the manifest of the default document version, or None."""
+        content = self.get_manifest_content(package)
+        if content is None:
+            return None
+        return json.loads(content)
+
+    def get_version_manifest(self, package, version):
+        """Return the manifest last published for a package version, or None.
+
+        Versions are matched by their version name, which create-package.py
+        derives from the package version as <version>-<manifest hash>.
+
+        :param package: Name of the distributor package
+        :param version: The package version, e.g. a sensor version
+        """
+        try:
+            published = [
+                published_version
+                for published_version in self._list_versions(package)
+                if published_version.get("VersionName", "").startswith(f"{version}-")
+            ]
+        except self._client.exceptions.InvalidDocument:
+            return None
+        if not published:
+            return None
+        latest = max(published, key=lambda item: int(item["DocumentVersion"]))
+        return json.loads(
+            self._client.get_document(
+                Name=package, DocumentVersion=latest["DocumentVersion"]
+            )["Content"]
+        )
+
+    def get_manifest_content(self, package):
+        """Return the manifest of the default document version as published, or None."""
+        current_doc = self._doc_exists(package)
+        if not current_doc:
+            return None
+        return current_doc["Content"]
+
+    def _doc_update_or_create(self, set_default, **kwargs):
+        """Determine if this is an update or create."""
+        if self._doc_exists(kwargs["Name"]):
+            self._doc_update(set_default, **kwargs)
+        else:
+            self._client.create_document(**kwargs)
+
+    def _doc_exists(self, package):
+        """Document exists."""
+        try:
+            current_doc = self._client.get_document(Name=package)
+        except self._client.exceptions.InvalidDocument:
+            current_doc = {}
+        return current_doc
+
+    def _doc_update(self, set_default, **kwargs):
+        """Perform the document update.
+
+        A manifest that is already published is not published again, its
+        existing version is made the default version instead. A version
+        name that is already published with a different manifest is an
+        error, since publishing under another name is the caller's choice.
+        """
+        del kwargs["DocumentType"]
+        kwargs["DocumentVersion"] = "$LATEST"
+        try:
+            updated = self._client.update_document(**kwargs)
+            document_version = updated["DocumentDescription"]["DocumentVersion"]
+        except self._client.exceptions.DuplicateDocumentContent:
+            document_version = self._client.get_document(
+                Name=kwargs["Name"], DocumentVersion="$LATEST"
+            )["DocumentVersion"]
+            print(
+                f"AWS SSM Package is already up to date with version {document_version}"
+            )
+        except self._client.exceptions.DuplicateDocumentVersionName:
+            document_version = self._published_version(
+                kwargs["Name"], kwargs["VersionName"], kwargs["Content"]
+            )
+            print(
+                f"AWS SSM Package version {kwargs['VersionName']} has already been published"
+            )
+        except self._client.exceptions.DocumentVersionLimitExceeded:
+            self._doc_cleanup_versions(kwargs["Name"])
+            updated = self._client.update_document(**kwargs)
+            document_version = updated["DocumentDescription"]["DocumentVersion"]
+
+        if not set_default:
+            return
+        self._client.update_document_default_version(
+            Name=kwargs["Name"], DocumentVersion=document_version
+        )
+
+    def _published_version(self, package, version_name, content):
+        """Return the document version published under a version name.
+
+        Exits if that version was published with a different manifest.
+        """
+        for version in self._list_versions(package):
+            if version.get("VersionName") != version_name:
+                continue
+            published = self._client.get_document(
+                Name=package, DocumentVersion=version["DocumentVersion"]
+            )
+            if published["Content"] != content:
+                print(
+                    f"AWS SSM Package version {version_name} was already published "
+                    f"with a different manifest in {self.region}, "
+                    "publish the new manifest under another version name."
+                )
+                sys.exit(1)
+            return version["DocumentVersion"]
+        print(f"AWS SSM Package version {version_name} not found in {self.region}")
+        sys.exit(1)
+
+    def _list_versions(self, package):
+        """Yield the versions of a document, following pagination."""
+        kwargs = {"Name": package}
+        while True:
+            response = self._client.list_document_versions(**kwargs)
+            yield from response["DocumentVersions"]
+            if not response.get("NextToken"):
+                return
+            kwargs["NextToken"] = response["NextToken"]
+
+    def _doc_cleanup_versions(self, package):
+        """Cleanup document versions."""
+        for version in list(self._list_versions(package)):
+            if version["IsDefaultVersion"]:
+                continue
+            self._client.delete_document(
+                Name=package, DocumentVersion=version["DocumentVersion"]
+            )
+
+    @cached_property
+    def _client(self):
+        """Return an instance of the SSM client."""
+        return backends.client("ssm", self.region)
+
+
+def upload_plan(file_list, prefix="", content_addressed=()):
+    """Return the S3 objects to upload for files in PATH_TO_BUCKET_FOLDER.
+
+    Plans of several file lists can be merged with dict.update() and
+    uploaded in one batch with S3BucketUpdater.upload().
+
+    :param file_list: Names of the files to upload
+    :param prefix: Prefix of the S3 object names
+    :param content_addressed: Files named after their content, which are
+        not uploaded when the bucket already has an object of that name
+    :return: {object key: (file name, content addressed)}
+    """
+    content_addressed = set(content_addressed)
+    return {prefix + file: (file, file in content_addressed) for file in file_list}
+
+
+class S3BucketUpdater:  # pylint: disable=R0903
+    """Class to represent our S3 Bucket update."""
+
+    def __init__(self, region_name):
+        self.region = region_name
+        self._known_buckets = set()
+
+    def update(  # pylint: disable=R0913
+        self, bucket_name, file_list, prefix="", journal=None, content_addressed=()
+    ):
+        """Update the bucket contents.
+
+        :param bucket_name: The name of the S3 bucket
+        :param file_list: Names of the files in PATH_TO_BUCKET_FOLDER to upload
+        :param prefix: Prefix of the S3 object names
+        :param journal: Optional CheckpointJournal, objects it records with the
+            current file checksum are not uploaded again
+        :param content_addressed: Files named after their content, which are
+            not uploaded when the bucket already has an object of that name
+        :return: True if every file was uploaded
+        """
+        return self.upload(
+            bucket_name, upload_plan(file_list, prefix, content_addressed), journal
+        )
+
+    def upload(self, bucket_name, plan, journal=None):
+        """Upload the objects of an upload plan.
+
+        The bucket is checked, and created if needed, once. Objects are
+        then uploaded concurrently, each file only once even if it is
+        shared by several package versions.
+
+        :param bucket_name: The name of the S3 bucket
+        :param plan: {object key: (file name, content addressed)}, see upload_plan()
+        :param journal: Optional CheckpointJournal, objects it records with the
+            current file checksum are not uploaded again
+        :return: True if every file was uploaded
+        """
+        if bucket_name not in self._known_buckets:
+            if not self._bucket_exists(bucket_name):
+                self._create_bucket(bucket_name)
+            self._known_buckets.add(bucket_name)
+        with ThreadPoolExecutor(max_workers=MAX_UPLOAD_WORKERS) as executor:
+            results = executor.map(
+                lambda item: self._upload_checkpointed(
+                    item[1][0], bucket_name, item[0], journal, item[1][1]
+                ),
+                sorted(plan.items()),
+            )
+        return all(results)
+
+    def _upload_checkpointed(  # pylint: disable=R0913
+        self, file, bucket_name, object_name, journal, content_addressed=False
+    ):
+        """Upload a file unless the journal or the bucket already has it."""
+        file_path = PATH_TO_BUCKET_FOLDER + file
+        key = f"{bucket_name}/{object_name}"
+        if journal is not None and journal.verified("upload", key, file_path):
+            print(f"Skipping {file}: already uploaded")
+            return True
+        if content_addressed and self._object_exists(
+            bucket_name, object_name, os.path.getsize(file_path)
+        ):
+            print(f"Skipping {file}: already stored in the bucket")
+            return True
+        if not self._upload_file(file_path, bucket_name, object_name):
+            return False
+        if journal is not None:
+            journal.record("upload", key, sha256=file_sha256(file_path))
+        return True
+
+    def _object_exists(self, bucket_name, key, size):
+        """Return True if the bucket has an object of that key and size."""
+        try:
+            response = self._client.head_object(Bucket=bucket_name, Key=key)
+        except (BotoCoreError, ClientError):
+            return False
+        return response["ContentLength"] == size
+
+    def _bucket_exists(self, bucket_name):
+        """
+        Checks that the S3 bucket exists, with a single HeadBucket call
+        rather than listing every bucket of the account
+        :param bucket_name: The name of the S3 bucket
+        :return: True or False
+        """
+        try:
+            self._client.head_bucket(Bucket=bucket_name)
+        except ClientError as err:
+            if err.response["Error"]["Code"] in ("404", "NoSuchBucket", "NotFound"):
+                return False
+            print(f"Error checking bucket {bucket_name}: {err}")
+            raise
+        print("Bucket already exists:")
+        return True
+
+    def _create_bucket(self, bucket_name):
+        """Create an S3 bucket
+
+        :param bucket_name: Bucket to create
+        :return: True if bucket created, else False
+        """
+
+        print("Creating bucket:")
+        location = {"LocationConstraint": self.region}
+        self._client.create_bucket(
+            Bucket=bucket_name, CreateBucketConfiguration=location
+        )
+
+    def _upload_file(self, file_name, bucket, object_name=None):
+        """Upload a file to an S3 bucket
+
+        :param file_name: File to upload
+        :param bucket: Bucket to upload to
+        :param object_name: S3 object name. If not specified then file_name is used
+        :return: True if file was uploaded, else False
+        """
+        # If S3 object_name was not specified, use file_name
+        if object_name is None:
+            object_name = file_name
+
+        try:
+            start_time = time.time()
+            print(f"Uploading file {file_name}:")
+            with open(file_name, "rb") as content:
+                self._client.put_object(Bucket=bucket, Key=object_name, Body=content)
+            time_taken = time.time() - start_time
+            print(
+                f"Successfully finished uploading files to s3 bucket. Took {time_taken}s"
+            )
+        except (BotoCoreError, ClientError) as err:
+            print(f"Upload error {err}")
+            return False
+        return True
+
+    @cached_property
+    def _client(self):
+        return backends.client("s3", self.region)
+
+
+def manifest_file_name(package_name, version, content):
+    """Return the name of the manifest file of a package version.
+
+    The manifest is kept in a directory named after the package, so the
+    documents sharing a bucket each have their own manifest objects, and
+    is named after its content, so two different manifests of the same
+    version never share an object.
+
+    :param package_name: The distributor package, None for the bucket folder root
+    :param version: The package version
+    :param content: The manifest, as published in the document
+    """
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    file = f"manifest-{version}-{digest[:16]}.json"
+    if package_name is None:
+        return file
+    return f"{package_name}/{file}"
+
+
+class DistributorPackager:  # pylint: disable=R0903
+    """Class to represent a Distributor package."""
+
+    # Paths besides agent_list.json whose changes affect every platform
+    WATCH_PATHS = ()
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        version=INSTALLER_VERSION,
+        source_dir=".",
+        live_manifest=None,
+        partial=False,
+        package_name=None,
+        release=None,
+    ):
+        """
+        :param version: The package version written to the manifest
+        :param source_dir: Directory containing the CS_* package directories
+        :param live_manifest: Optional manifest of the published package, whose
+            unchanged files are referenced instead of uploaded again
+        :param partial: Keep the live manifest's platforms that are not part
+            of this build
+        :param package_name: The distributor package the manifest is
+            published as, which names the manifest's directory
+        :param release: Name of the build, unique to its sources, which keys
+            its checkpoint. Defaults to the version.
+        """
+        self.version = version
+        self.source_dir = source_dir
+        self.live_manifest = live_manifest
+        self.partial = partial
+        self.package_name = package_name
+        self.release = release or version
+        self._manifest_content = None
+
+    @property
+    def manifest_file(self):
+        """Name of the manifest generated by the last build."""
+        return manifest_file_name(self.package_name, self.version, self.manifest_content)
+
+    @property
+    def manifest_content(self):
+        """The manifest generated by the last build."""
+        return self._manifest_content
+
+    @property
+    def content_version_name(self):
+        """Document version name for the last build, unique to its manifest.
+
+        The package version followed by a short hash of the manifest, so a
+        change to the scripts alone is published as a new version, and an
+        identical build maps back to the version already published.
+        """
+        digest = hashlib.sha256(self.manifest_content.encode("utf-8")).hexdigest()
+        return f"{self.version}-{digest[:8]}"
+
+    def generate_files(self, mapping_index):  # pylint: disable=W0613
+        """Return the files generated at build time.
+
+        The package directories are zipped as they are. Layouts that
+        generate files, such as install scripts rendered for each platform,
+        override this method.
+
+        :param mapping_index: The MappingIndex of the platforms being built
+        :return: Tuple of ({directory: {file name: content}} of files added
+            to, or replacing files in, the platform zips, {file name: sha256}
+            of other files published with the package). Those files are in
+            PATH_TO_BUCKET_FOLDER, unless the live manifest already has them.
+        """
+        return {}, {}
+
+    def build(self, mapping_index, journal=None, remove_unchanged=True):
+        """Build the package.
+
+        Zip files are named after their content hash, so identical
+        artifacts built for different package versions share one file.
+        Files whose checksum matches a file of the live manifest keep the
+        live file name and are not returned for upload.
+
+        :param mapping_index: The MappingIndex parsed from agent_list.json
+        :param journal: Optional CheckpointJournal, a build it records is
+            reused as long as its files are intact
+        :param remove_unchanged: Remove the local copies of files that are
+            not returned for upload. Concurrent builds share zip files, so
+            they pass False and call remove_local_copies() once all are done.
+        :return: Set of file names to upload
+        """
+        if journal is not None:
+            entry = journal.get("build", self.release)
+            if entry is not None and all(
+                os.path.isfile(PATH_TO_BUCKET_FOLDER + file)
+                and file_sha256(PATH_TO_BUCKET_FOLDER + file) == sha
+                for file, sha in entry["files"].items()
+            ):
+                print(f"Package {self.release}: reusing checkpointed build")
+                with open(
+                    PATH_TO_BUCKET_FOLDER + entry["manifest"], "r", encoding="utf-8"
+                ) as manifest:
+                    self._manifest_content = manifest.read()
+                return set(entry["files"])
+        missing_dirs = mapping_index.missing_dirs(self.source_dir)
+
+        if len(missing_dirs) > 0:
+            print(
+                f"Missing directories: {missing_dirs} - this is caused by agent_list.json expecting a package to exist. If you modified the scripts this could mean something went wrong. Please report the issue on our github page."
+            )
+            sys.exit(1)
+        generated_files, extra_files = self.generate_files(mapping_index)
+        artifacts = {
+            directory: self._create_zip_files(
+                self.source_dir,
+                directory,
+                mappings[0].file,
+                generated_files.get(directory),
+            )
+            for directory, mappings in mapping_index.by_dir.items()
+        }
+        built_files = set(artifacts.values())
+        digests = self._iter_digests(sorted(built_files))
+        live_files = {}
+        if self.live_manifest:
+            live_files = self.live_manifest["files"]
+            artifacts, digests = self._reuse_live_files(artifacts, digests, live_files)
+        digests = itertools.chain(digests, sorted(extra_files.items()))
+        try:
+            self._manifest_content = self._generate_manifest(
+                mapping_index,
+                artifacts,
+                digests,
+                self.version,
+                self.live_manifest if self.partial else None,
+            )
+        except ManifestSizeError as err:
+            print(f"Package {self.release}: {err}")
+            sys.exit(1)
+        manifest_path = PATH_TO_BUCKET_FOLDER + self.manifest_file
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, "w", encoding="utf-8") as manifest:
+            manifest.write(self._manifest_content)
+        package_files = set(artifacts.values()) | set(extra_files)
+        file_list = {file for file in package_files if file not in live_files}
+        # Unchanged files are already published, drop the local copies
+        if remove_unchanged:
+            for file in (built_files | set(extra_files)) - file_list:
+                if os.path.exists(PATH_TO_BUCKET_FOLDER + file):
+                    os.remove(PATH_TO_BUCKET_FOLDER + file)
+        print(
+            f"Package {self.release}: {len(package_files) - len(file_list)} "
+            f"unchanged files, {len(file_list)} to upload"
+        )
+        file_list.add(self.manifest_file)
+        if journal is not None:
+            journal.record(
+                "build",
+                self.release,
+                files={
+                    file: file_sha256(PATH_TO_BUCKET_FOLDER + file)
+                    for file in file_list
+                },
+                manifest=self.manifest_file,
+            )
+        return file_list
+
+    @staticmethod
+    def _reuse_live_files(artifacts, digests, live_files):
+        """Point artifacts at live files that have the same checksum.
+
+        :param artifacts: dictionary of {directory: zip file name}
+        :param digests: iterable of (file name, sha256) pairs
+        :param live_files: the "files" section of the live manifest
+        :return: The updated artifacts and a list of (file name, sha256) pairs
+        """
+        live_by_sha = {
+            meta["checksums"]["sha256"]: file for file, meta in live_files.items()
+        }
+        renamed = {}
+        live_digests = []
+        for file, sha in digests:
+            if file not in live_files:
+                renamed[file] = live_by_sha.get(sha, file)
+            else:
+                renamed[file] = file
+            live_digests.append((renamed[file], sha))
+        return (
+            {directory: renamed[file] for directory, file in artifacts.items()},
+            live_digests,
+        )
+
+    @staticmethod
+    def _generate_manifest(
+        mapping_index,
+        artifacts,
+        digests,
+        version=INSTALLER_VERSION,
+        live_manifest=None,
+    ):  # pylint: disable=R0913
+        """
+        Generates the manifest required to create the ssm document
+        :param mapping_index: MappingIndex of the platforms in the package
+        :param artifacts: dictionary of {directory: zip file name}
+        :param digests: iterable of (file name, sha256) pairs
+        :param version: The package version
+        :param live_manifest: Optional published manifest to carry the other platforms over from
+        :return: The manifest content
+        :raises ManifestSizeError: If the manifest does not fit in an SSM document
+        """
+        builder = ManifestBuilder(version, PACKAGE_DESCRIPTION)
+        for platform, mapping in mapping_index.by_platform.items():
+            builder.add_platform(platform, {"file": artifacts[mapping.dir]})
+        if live_manifest:
+            builder.carry_over(live_manifest, mapping_index.by_platform)
+        builder.add_digests(digests)
+        return builder.serialize()
+
+    @staticmethod
+    def _create_zip_files(source_dir, directory, file_name, generated_files=None):
+        """Create a zip file from the contents of the specified directory.
+
+        Entries are written in a stable order with a fixed timestamp so the
+        zip only changes when its contents do.
+
+        :param source_dir: Directory containing the package directory
+        :param directory: The package directory to zip
+        :param file_name: The zip file name from the mappings file
+        :param generated_files: Optional {name: content} of files generated
+            at build time, which replace files of the same name on disk
+        :return: The content addressed name of the zip file
+        """
+        generated_files = generated_files or {}
+        tmp_fd, tmp_path = tempfile.mkstemp(
+            prefix=f".{directory}.", suffix=".tmp", dir=PATH_TO_BUCKET_FOLDER
+        )
+        with os.fdopen(tmp_fd, "wb") as tmp_file, zipfile.ZipFile(
+            tmp_file, "w", zipfile.ZIP_DEFLATED
+        ) as zipf:
+            for root, dir_names, file_list in os.walk(
+                os.path.join(source_dir, directory)
+            ):
+                dir_names.sort()
+                for file in sorted(file_list):
+                    if file in generated_files:
+                        continue
+                    file_path = os.path.join(root, file)
+                    info = zipfile.ZipInfo(basename(file_path), ZIP_DATE_TIME)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.external_attr = (os.stat(file_path).st_mode & 0o777) << 16
+                    with open(file_path, "rb") as src, zipf.open(info, "w") as dst:
+                        shutil.copyfileobj(src, dst)
+            for name, content in sorted(generated_files.items()):
+                info = zipfile.ZipInfo(name, ZIP_DATE_TIME)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o755 << 16
+                zipf.writestr(info, content)
+        digest = DistributorPackager._file_digest(tmp_path)
+        stem, ext = os.path.splitext(file_name)
+        content_name = f"{stem}-{digest[:16]}{ext}"
+        # Identical content yields the same name, so concurrent builds can race safely
+        os.replace(tmp_path, PATH_TO_BUCKET_FOLDER + content_name)
+        return content_name
+
+    @staticmethod
+    def _file_digest(file_path):
+        """Return the sha256 hex digest of a file."""
+        return file_sha256(file_path)
+
+    @staticmethod
+    def _iter_digests(file_list):
+        """Yield (file name, sha256) pairs for files in PATH_TO_BUCKET_FOLDER."""
+        for file in file_list:
+            yield file, file_sha256(PATH_TO_BUCKET_FOLDER + file)
+
+
+def is_build_artifact(file, mapping_index):
+    """Return True for a file name that a build writes to PATH_TO_BUCKET_FOLDER.
+
+    :param file: Name of a file in PATH_TO_BUCKET_FOLDER
+    :param mapping_index: The MappingIndex of the package
+    :return: True for temporary files, manifests and platform zips, with or
+        without their content hash
+    """
+    if file.startswith(".") or re.fullmatch(r"manifest(-.+)?\.json", file):
+        return True
+    for mapping in mapping_index:
+        stem, ext = os.path.splitext(mapping.file)
+        if re.fullmatch(re.escape(stem) + r"(-[0-9a-f]{16})?" + re.escape(ext), file):
+            return True
+    return False
+
+
+def remove_local_copies(keep):
+    """Remove the files in PATH_TO_BUCKET_FOLDER that are not in keep.
+
+    :param keep: Names of the files to keep, such as the files to upload
+    """
+    for file in os.listdir(PATH_TO_BUCKET_FOLDER):
+        if file not in keep and os.path.isfile(PATH_TO_BUCKET_FOLDER + file):
+            os.remove(PATH_TO_BUCKET_FOLDER + file)
+
+
+def publish_package(package_name, regions, bucket_name, releases, journal=None):
+    """Publish package versions as SSM distributor document versions.
+
+    Versions are published one after another in each region, since they are
+    all updates of the same document.
+
+    :param package_name: Name of the distributor package
+    :param regions: List of regions to publish to
+    :param bucket_name: The S3 bucket holding the package files
+    :param releases: List of (packager, version_name, set_default) tuples
+    :param journal: Optional CheckpointJournal, versions it records as
+        published with the same manifest are skipped
+    """
+    for region in regions:
+        print(f"Creating distributor package in {region}")
+        updater = SSMPackageUpdater(region)
+        for packager, version_name, set_default in releases:
+            manifest_file = packager.manifest_file
+            manifest_path = PATH_TO_BUCKET_FOLDER + manifest_file
+            key = f"{region}/{package_name}/{manifest_file}"
+            if journal is not None and journal.verified("publish", key, manifest_path):
+                print(f"Skipping {manifest_file}: already published in {region}")
+                continue
+            updater.update(
+                package_name,
+                packager.manifest_content,
+                bucket_name,
+                version_name=version_name,
+                set_default=set_default,
+            )
+            if journal is not None:
+                journal.record("publish", key, sha256=file_sha256(manifest_path))
+        print("Distributor package has been built successfully.")
+
+
+def add_arguments(parser):
+    """Add the packaging engine options to a layout's argument parser."""
+    parser.add_argument(
+        "-r",
+        "--aws_regions",
+        "--aws_region",
+        help="A comma seperate list of aws regions to create the ssm distributor package in.",
+    )
+    parser.add_argument(
+        "-p",
+        "--package_name",
+        help="The name of the distributor package to create.",
+        default="CrowdStrike-FalconSensor",
+    )
+    parser.add_argument(
+        "-b",
+        "--s3bucket",
+        help="The name of the s3 bucket to upload the required files to.",
+    )
+    parser.add_argument(
+        "-v",
+        "--version_name",
+        help="Optional version name to publish the distributor package as.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run from its checkpoint, skipping the steps it completed.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=backends.BACKENDS,
+        default="aws",
+        help="Publish to AWS, or to local S3 and SSM fakes for offline runs.",
+    )
+    parser.add_argument(
+        "--local_root",
+        default=backends.LOCAL_ROOT,
+        help="Directory holding the state of the local backend.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and republish the changed platforms to <package_name>-dev in the "
+        "first region whenever the package directories or agent_list.json change.",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Write a cProfile of each stage of the run, its tracemalloc and RSS peaks, "
+        "and a summary.json to this directory.",
+    )
+
+
+def run(args, packager_class=DistributorPackager, **packager_kwargs):
+    """Build, upload and publish the package in the current directory.
+
+    :param args: Parsed arguments, including those of add_arguments()
+    :param packager_class: DistributorPackager or a layout's subclass
+    :param packager_kwargs: Extra arguments for the packager class
+    """
+    backends.configure(args.backend, args.local_root)
+    profiler = StageProfiler(args.profile)
+    try:
+        if args.watch:
+            with profiler.stage("watch"):
+                watch(args, packager_class, **packager_kwargs)
+        else:
+            _run(args, profiler, packager_class, **packager_kwargs)
+    finally:
+        profiler.close()
+
+
+def _run(args, profiler, packager_class, **packager_kwargs):
+    """Build, upload and publish the package once, see run()."""
+    regions = args.aws_regions
+    package_name = args.package_name
+    s3bucket = args.s3bucket
+
+    if not os.path.exists(PATH_TO_BUCKET_FOLDER):
+        os.makedirs(PATH_TO_BUCKET_FOLDER)
+
+    try:
+        mapping_index = MappingIndex.from_file("agent_list.json")
+    except MappingError as err:
+        print(f"Invalid agent_list.json: {err}")
+        sys.exit(1)
+
+    journal = CheckpointJournal(
+        CHECKPOINT_FILE,
+        resume=args.resume,
+        # Every option, including the layout's own, identifies the run
+        run_args={
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("resume", "profile")
+        },
+    )
+
+    live_manifest = None
+    if regions is not None and package_name is not None:
+        with profiler.stage("live_manifest"):
+            live_manifest = SSMPackageUpdater(regions.split(",")[0]).get_manifest(
+                package_name
+            )
+
+    packager = packager_class(
+        version=args.version_name or INSTALLER_VERSION,
+        live_manifest=live_manifest,
+        package_name=package_name,
+        **packager_kwargs,
+    )
+    with profiler.stage("build"):
+        files = packager.build(mapping_index, journal)
+
+    if regions is None or s3bucket is None:
+        print(
+            "Skipping AWS upload: please provide --aws_region, --ssm_automation_doc_name, and --s3bucket command-line "
+            "options for upload"
+        )
+        return
+
+    regions = regions.split(",")
+
+    # Other files in PATH_TO_BUCKET_FOLDER are uploaded with the package, at
+    # the root of the bucket, except what earlier or interrupted builds left
+    supporting_files = []
+    for file in os.listdir(PATH_TO_BUCKET_FOLDER):
+        if file in files or not os.path.isfile(PATH_TO_BUCKET_FOLDER + file):
+            continue
+        if is_build_artifact(file, mapping_index):
+            print(f"Ignoring {file}: left over from an earlier build")
+            continue
+        supporting_files.append(file)
+    plan = upload_plan(supporting_files)
+    plan.update(
+        upload_plan(files, "falcon/", content_addressed=files - {packager.manifest_file})
+    )
+    with profiler.stage("upload"):
+        uploaded = S3BucketUpdater(regions[0]).upload(s3bucket, plan, journal)
+    if not uploaded:
+        print("Unable to upload all package files, re-run with --resume to retry.")
+        sys.exit(1)
+    print("Package file have been built and uploaded successfully.")
+
+    if package_name is not None:
+        with profiler.stage("publish"):
+            publish_package(
+                package_name,
+                regions,
+                s3bucket,
+                [(packager, args.version_name, True)],
+                journal,
+            )
+
+    print("Cleaning up files...")
+    shutil.rmtree(PATH_TO_BUCKET_FOLDER)
+    journal.remove()
+
+
+def watch(args, packager_class=DistributorPackager, **packager_kwargs):
+    """Republish the package to its dev document until interrupted.
+
+    :param args: Parsed arguments, including those of add_arguments()
+    :param packager_class: DistributorPackager or a layout's subclass
+    :param packager_kwargs: Extra arguments for the packager class
+    """
+    from .watch import DEV_SUFFIX, PackageWatcher  # pylint: disable=C0415
+
+    if args.aws_regions is None or args.s3bucket is None:
+        print("Watch mode needs --aws_region and --s3bucket to publish to.")
+        sys.exit(1)
+    regions = args.aws_regions.split(",")
+    if len(regions) > 1:
+        print(f"Watch mode only publishes to the first region, {regions[0]}")
+    watcher = PackageWatcher(
+        packager_class,
+        regions[0],
+        args.s3bucket,
+        args.package_name + DEV_SUFFIX,
+        **packager_kwargs,
+    )
+    try:
+        watcher.watch()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    shutil.rmtree(PATH_TO_BUCKET_FOLDER, ignore_errors=True)
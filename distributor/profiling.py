@@ -0,0 +1,157 @@
+"""Per stage profiling of packaging runs, behind --profile.
+
+StageProfiler.stage() wraps a stage of a run, such as the build or the
+upload. For each stage it records:
+
+- a cProfile of the calling thread, written to <NN>-<stage>.pstats
+- the memory traced by tracemalloc at the start of the stage and its
+  peak during the stage, across all threads
+- the resident set size at the start and end of the stage, and its peak
+  sampled by a background thread
+
+summary.json in the output directory lists the stages. It is rewritten
+when each stage starts and ends, so a run killed for running out of memory
+still shows the stage it was in. Open the pstats files with
+`python3 -m pstats <file>` or a viewer such as snakeviz.
+
+Work done in thread pools shows up in the cProfile of the calling thread
+as time spent waiting on the workers. Stages must not be nested.
+"""
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SUMMARY_FILE = "summary.json"
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def current_rss():
+    """Return the resident set size of the process in bytes, or None if unknown."""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    # Without /proc only the peak is known, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _RSSSampler(threading.Thread):
+    """Track the peak resident set size until stopped."""
+
+    def __init__(self, interval):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        """Stop sampling and return the peak resident set size."""
+        self._done.set()
+        self.join()
+        self._sample()
+        return self.peak
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+
+class StageProfiler:
+    """Profile the stages of a run into a directory."""
+
+    def __init__(self, output_dir=None, rss_interval=RSS_SAMPLE_INTERVAL):
+        """
+        :param output_dir: Directory to write the profiles to, profiling is
+            disabled when None
+        :param rss_interval: Seconds between resident set size samples
+        """
+        self.output_dir = output_dir
+        self.rss_interval = rss_interval
+        self.stages = []
+        self._started = time.perf_counter()
+        if self.enabled:
+            os.makedirs(output_dir, exist_ok=True)
+            tracemalloc.start()
+            self._write_summary()
+
+    @property
+    def enabled(self):
+        """True if the run is being profiled."""
+        return self.output_dir is not None
+
+    @contextmanager
+    def stage(self, name):
+        """Profile the enclosed block as one stage of the run.
+
+        :param name: Name of the stage, used in the summary and pstats file name
+        """
+        if not self.enabled:
+            yield
+            return
+        entry = {"stage": name, "status": "running", "rss_start_bytes": current_rss()}
+        self.stages.append(entry)
+        self._write_summary()
+        tracemalloc.reset_peak()
+        entry["tracemalloc_start_bytes"] = tracemalloc.get_traced_memory()[0]
+        sampler = _RSSSampler(self.rss_interval)
+        sampler.start()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        status = "failed"
+        profile.enable()
+        try:
+            yield
+            status = "completed"
+        finally:
+            profile.disable()
+            entry["status"] = status
+            entry["seconds"] = round(time.perf_counter() - started, 3)
+            entry["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            entry["rss_peak_bytes"] = sampler.stop()
+            entry["rss_end_bytes"] = current_rss()
+            entry["pstats"] = (
+                f"{len(self.stages):02d}-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.pstats"
+            )
+            profile.dump_stats(os.path.join(self.output_dir, entry["pstats"]))
+            self._write_summary()
+
+    def close(self):
+        """Stop tracing memory and write the final summary."""
+        if not self.enabled:
+            return
+        self._write_summary()
+        tracemalloc.stop()
+        print(f"Profile written to {self.output_dir}")
+
+    def _write_summary(self):
+        summary = {
+            "argv": sys.argv,
+            "python": sys.version,
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "stages": self.stages,
+        }
+        summary_path = os.path.join(self.output_dir, SUMMARY_FILE)
+        with open(summary_path + ".tmp", "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        os.replace(summary_path + ".tmp", summary_path)
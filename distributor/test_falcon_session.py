@@ -0,0 +1,191 @@
+"""Tests of FalconSession against a stubbed HTTP session.
+
+    python3 -m unittest distributor.test_falcon_session
+"""
+import threading
+import unittest
+from types import SimpleNamespace
+
+try:
+    import requests
+
+    from distributor.backends import FalconAPIError
+    from distributor.falcon_session import BASE_URL, CLOUD_BASE_URLS, FalconSession
+except (ImportError, SystemExit):  # boto3 or requests is not installed
+    FalconSession = None
+
+
+def response(status_code, body=None, headers=None, content=b""):
+    """Return a stub of a requests response."""
+    return SimpleNamespace(
+        status_code=status_code,
+        headers=headers or {},
+        content=content,
+        json=lambda: body if body is not None else {},
+    )
+
+
+class StubHTTPSession:
+    """HTTP session stub answering from queues of responses."""
+
+    def __init__(self, tokens=(), gets=()):
+        """
+        :param tokens: Responses of the token endpoint, the last one repeats
+        :param gets: Responses or exceptions of GET requests, the last one repeats
+        """
+        self.tokens = list(tokens)
+        self.gets = list(gets)
+        self.posts = []
+        self.requests = []
+
+    def post(self, url, data, timeout):
+        self.posts.append((url, data, timeout))
+        return self.tokens.pop(0) if len(self.tokens) > 1 else self.tokens[0]
+
+    def get(self, url, params, headers, timeout):
+        self.requests.append((url, params, headers["Authorization"], timeout))
+        answer = self.gets.pop(0) if len(self.gets) > 1 else self.gets[0]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def token_response(token, expires_in=1800, region=None):
+    """Return a response of the token endpoint."""
+    return response(
+        201,
+        {"access_token": token, "expires_in": expires_in},
+        {"X-Cs-Region": region} if region else {},
+    )
+
+
+if FalconSession is not None:
+
+    class StubbedFalconSession(FalconSession):
+        """FalconSession sending every request through one StubHTTPSession."""
+
+        def __init__(self, http, **kwargs):
+            super().__init__(client_id="id", client_secret="secret", **kwargs)
+            self.http = http
+
+        @property
+        def _session(self):
+            return self.http
+
+
+@unittest.skipIf(FalconSession is None, "boto3 and requests are not installed")
+class FalconSessionTest(unittest.TestCase):
+    """FalconSession"""
+
+    def test_token_is_requested_once(self):
+        http = StubHTTPSession(
+            tokens=[token_response("one")], gets=[response(200, content=b"sensor")]
+        )
+        falcon = StubbedFalconSession(http, timeout=(1, 2))
+        for _ in range(3):
+            self.assertEqual(
+                falcon.command("DownloadSensorInstallerById", id="sha"), b"sensor"
+            )
+        self.assertEqual(falcon.token_requests, 1)
+        self.assertEqual(
+            http.requests[0],
+            (f"{BASE_URL}/sensors/entities/download-installer/v1", {"id": "sha"},
+             "Bearer one", (1, 2)),
+        )
+        self.assertEqual(http.posts[0][2], (1, 2))
+
+    def test_token_is_refreshed_before_it_expires(self):
+        now = [0]
+        http = StubHTTPSession(
+            tokens=[token_response("one", expires_in=120), token_response("two")],
+            gets=[response(200, {"resources": []})],
+        )
+        falcon = StubbedFalconSession(http, clock=lambda: now[0])
+        self.assertEqual(falcon.token(), "one")
+        now[0] = 59
+        self.assertEqual(falcon.token(), "one")
+        # Within the refresh margin of the expiry
+        now[0] = 61
+        self.assertEqual(falcon.token(), "two")
+        self.assertEqual(falcon.token_requests, 2)
+
+    def test_threads_share_one_token_request(self):
+        http = StubHTTPSession(tokens=[token_response("one")])
+        falcon = StubbedFalconSession(http)
+        tokens = []
+        threads = [
+            threading.Thread(target=lambda: tokens.append(falcon.token()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tokens, ["one"] * 8)
+        self.assertEqual(falcon.token_requests, 1)
+
+    def test_unauthorized_request_is_retried_with_a_new_token(self):
+        http = StubHTTPSession(
+            tokens=[token_response("revoked"), token_response("fresh")],
+            gets=[response(401, {"errors": []}), response(200, content=b"sensor")],
+        )
+        falcon = StubbedFalconSession(http)
+        self.assertEqual(falcon.command("DownloadSensorInstallerById", id="sha"), b"sensor")
+        self.assertEqual(
+            [authorization for _, _, authorization, _ in http.requests],
+            ["Bearer revoked", "Bearer fresh"],
+        )
+        self.assertEqual(falcon.token_requests, 2)
+
+    def test_unauthorized_request_is_retried_once(self):
+        http = StubHTTPSession(
+            tokens=[token_response("one"), token_response("two")],
+            gets=[response(401, {"errors": [{"code": 401}]})],
+        )
+        falcon = StubbedFalconSession(http)
+        result = falcon.command("DownloadSensorInstallerById", id="sha")
+        self.assertEqual(result["status_code"], 401)
+        self.assertEqual(result["body"], {"errors": [{"code": 401}]})
+        self.assertEqual(len(http.requests), 2)
+
+    def test_requests_follow_the_cloud_of_the_api_client(self):
+        http = StubHTTPSession(
+            tokens=[token_response("one", region="eu-1")],
+            gets=[response(200, {"resources": []})],
+        )
+        falcon = StubbedFalconSession(http)
+        result = falcon.command(
+            "GetCombinedSensorInstallersByQuery", filter="os:'Amazon Linux'"
+        )
+        self.assertEqual(result["body"], {"resources": []})
+        self.assertEqual(http.posts[0][0], f"{BASE_URL}/oauth2/token")
+        self.assertTrue(http.requests[0][0].startswith(CLOUD_BASE_URLS["eu-1"] + "/"))
+
+    def test_unknown_cloud_keeps_the_base_url(self):
+        http = StubHTTPSession(
+            tokens=[token_response("one", region="xx-9")],
+            gets=[response(200, {"resources": []})],
+        )
+        falcon = StubbedFalconSession(http, base_url=CLOUD_BASE_URLS["us-2"])
+        falcon.command("GetCombinedSensorInstallersByQuery", filter="")
+        self.assertTrue(http.requests[0][0].startswith(CLOUD_BASE_URLS["us-2"] + "/"))
+
+    def test_failed_authentication(self):
+        http = StubHTTPSession(tokens=[response(403, {"errors": []})])
+        with self.assertRaises(FalconAPIError):
+            StubbedFalconSession(http).token()
+
+    def test_timeout(self):
+        http = StubHTTPSession(
+            tokens=[token_response("one")], gets=[requests.Timeout("read timed out")]
+        )
+        with self.assertRaises(FalconAPIError):
+            StubbedFalconSession(http).command("DownloadSensorInstallerById", id="sha")
+
+    def test_unsupported_operation(self):
+        with self.assertRaises(ValueError):
+            StubbedFalconSession(StubHTTPSession()).command("QueryDevicesByFilter")
+
+
+if __name__ == "__main__":
+    unittest.main()
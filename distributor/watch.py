@@ -0,0 +1,190 @@
+"""Watch mode for a fast edit and test loop.
+
+PackageWatcher publishes the package once, then polls agent_list.json and
+the package directories for changes. Once the files have stopped changing
+for the debounce delay, it rebuilds the zips of the changed directories
+only and republishes the manifest. Only the rebuilt zips are uploaded, and
+the other platforms are carried over from the previously published
+manifest. A change to agent_list.json, or to a shared path of the layout
+such as the custom-api install script template, rebuilds every platform.
+
+Polling only needs the standard library and works the same on every OS.
+Its cost is a stat() per watched file on each poll, which is small next
+to the package directories' size.
+
+Watch mode publishes to a separate dev document, <package_name>-dev, in
+the first region only.
+"""
+
+import json
+import os
+import time
+
+from .mappings import MappingError, MappingIndex
+from .packager import (
+    INSTALLER_VERSION,
+    PATH_TO_BUCKET_FOLDER,
+    S3BucketUpdater,
+    SSMPackageUpdater,
+    publish_package,
+)
+
+MAPPINGS_FILE = "agent_list.json"
+DEV_SUFFIX = "-dev"
+POLL_INTERVAL = 0.5
+DEBOUNCE = 1.0
+
+
+def snapshot(paths):
+    """Return {file path: (mtime, size)} for the files under the paths."""
+    files = {}
+    for path in paths:
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+            continue
+        for root, _, file_list in os.walk(path):
+            for file in file_list:
+                file_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                files[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+class PackageWatcher:  # pylint: disable=R0902
+    """Rebuild and republish the package when its files change."""
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        packager_class,
+        region,
+        bucket_name,
+        package_name,
+        poll_interval=POLL_INTERVAL,
+        debounce=DEBOUNCE,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        **packager_kwargs,
+    ):
+        """
+        :param packager_class: DistributorPackager or a layout's subclass
+        :param region: The region of the bucket and the dev document
+        :param bucket_name: The dev S3 bucket
+        :param package_name: The dev distributor document
+        :param poll_interval: Seconds between checks for changes
+        :param debounce: Seconds without changes before rebuilding
+        :param clock: Function returning the current time in seconds
+        :param sleep: Function used to wait between checks
+        :param packager_kwargs: Extra arguments for the packager class
+        """
+        self.packager_class = packager_class
+        self.region = region
+        self.bucket_name = bucket_name
+        self.package_name = package_name
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.clock = clock
+        self.sleep = sleep
+        self.packager_kwargs = packager_kwargs
+        self.mapping_index = None
+        self.live_manifest = None
+        self._s3 = S3BucketUpdater(region)
+
+    @property
+    def shared_paths(self):
+        """Paths whose changes affect every platform."""
+        return [MAPPINGS_FILE] + list(self.packager_class.WATCH_PATHS)
+
+    def watch(self):
+        """Publish the package, then republish it on every change."""
+        self.mapping_index = MappingIndex.from_file(MAPPINGS_FILE)
+        self.live_manifest = SSMPackageUpdater(self.region).get_manifest(
+            self.package_name
+        )
+        self.publish(self.mapping_index, partial=False)
+        built = self._snapshot()
+        current = built
+        changed_at = None
+        print(f"Watching for changes, publishing to {self.package_name} in {self.region}")
+        while True:
+            self.sleep(self.poll_interval)
+            latest = self._snapshot()
+            if latest != current:
+                current = latest
+                changed_at = self.clock()
+                continue
+            if changed_at is None or self.clock() - changed_at < self.debounce:
+                continue
+            changed_at = None
+            self.rebuild(built, current)
+            built = current
+
+    def rebuild(self, before, after):
+        """Rebuild the platforms affected by the changes between two snapshots."""
+        changed = {
+            path
+            for path in set(before) | set(after)
+            if before.get(path) != after.get(path)
+        }
+        shared_dirs = tuple(os.path.join(path, "") for path in self.shared_paths)
+        if any(
+            path in self.shared_paths or path.startswith(shared_dirs) for path in changed
+        ):
+            try:
+                self.mapping_index = MappingIndex.from_file(MAPPINGS_FILE)
+            except (MappingError, ValueError) as err:
+                print(f"Invalid {MAPPINGS_FILE}, waiting for a fix: {err}")
+                return
+            print("Shared files changed, rebuilding every platform")
+            self.publish(self.mapping_index, partial=False)
+            return
+        dirs = {os.path.relpath(path).split(os.sep)[0] for path in changed}
+        mappings = [mapping for mapping in self.mapping_index if mapping.dir in dirs]
+        if not mappings:
+            return
+        print(f"Changed: {', '.join(sorted(dirs & set(self.mapping_index.by_dir)))}")
+        self.publish(MappingIndex(mappings), partial=True)
+
+    def publish(self, mapping_index, partial):
+        """Build the platforms, upload what changed and publish the manifest.
+
+        :param mapping_index: The platforms to build
+        :param partial: Keep the other platforms of the published manifest
+        """
+        started = self.clock()
+        os.makedirs(PATH_TO_BUCKET_FOLDER, exist_ok=True)
+        packager = self.packager_class(
+            version=INSTALLER_VERSION,
+            live_manifest=self.live_manifest,
+            partial=partial,
+            package_name=self.package_name,
+            **self.packager_kwargs,
+        )
+        try:
+            files = packager.build(mapping_index)
+        except SystemExit:
+            print("Build failed, waiting for the next change")
+            return
+        uploaded = self._s3.update(
+            self.bucket_name,
+            files,
+            "falcon/",
+            content_addressed=files - {packager.manifest_file},
+        )
+        if not uploaded:
+            print("Upload failed, waiting for the next change")
+            return
+        publish_package(
+            self.package_name, [self.region], self.bucket_name, [(packager, None, True)]
+        )
+        self.live_manifest = json.loads(packager.manifest_content)
+        for file in files:
+            if os.path.isfile(PATH_TO_BUCKET_FOLDER + file):
+                os.remove(PATH_TO_BUCKET_FOLDER + file)
+        print(f"Published {len(files)} files in {self.clock() - started:.1f}s")
+
+    def _snapshot(self):
+        return snapshot(self.shared_paths + self.mapping_index.dirs)